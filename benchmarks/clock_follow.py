@@ -0,0 +1,109 @@
+"""Lock time and tracking error of the external clock follower against a synthetic jittery clock source.
+
+The source sends 24 ticks per beat with gaussian jitter, occasional late spikes and dropped ticks, and
+jumps to another tempo half way. The tracker is first fed the tick times directly (how fast it locks and
+settles, how far its tempo and predicted grid are from the source), then the whole clock follows the
+source in real time through a fake MIDI input and the re-emitted clock's intervals are compared with
+the source's.
+
+    PYTHONPATH=src python benchmarks/clock_follow.py [--bpm=120] [--to-bpm=126] [--jitter-ms=1.0] [--seconds=10]
+"""
+import random
+import sys
+import threading
+import time
+
+from devices.fake_connector import FakeMidiConnector
+from devices.midi_clock import ClockFollower, MidiClock, TICKS_PER_BEAT
+from devices.tempo_tracker import TempoTracker
+from runtime_modes import TickRecordingConnector
+
+
+def source_ticks(bpm: float, to_bpm: float, seconds: float, jitter: float, seed: int = 1):
+    # (true time, arrival time) of every tick that arrives, the tempo jumps at seconds / 2
+    rng = random.Random(seed)
+    ticks, at = [], 0.0
+    while at < seconds:
+        at += 60.0 / ((bpm if at < seconds / 2 else to_bpm) * TICKS_PER_BEAT)
+        if rng.random() < 0.005:
+            continue
+        spike = rng.uniform(3, 6) * jitter if rng.random() < 0.01 else 0.0
+        ticks.append((at, at + abs(rng.gauss(0, jitter)) + spike))
+    return ticks
+
+
+def percentiles(values: list[float]) -> str:
+    values = sorted(values)
+    return f"p50 {values[len(values) // 2]:.3f} p99 {values[int(len(values) * 0.99)]:.3f} max {values[-1]:.3f}"
+
+
+def bench_tracker(bpm: float, to_bpm: float, seconds: float, jitter: float):
+    tracker = TempoTracker()
+    locked_at = settled_at = None
+    tempo_errors, phase_errors, settles = [], [], []
+    for true_at, arrival in source_ticks(bpm, to_bpm, seconds, jitter):
+        true_bpm = bpm if true_at < seconds / 2 else to_bpm
+        if tracker.locked:
+            phase_errors.append(abs(tracker.next_tick_after(arrival - tracker.period / 2) - true_at) * 1000)  # type: ignore
+        tracker.tick(arrival)
+        if tracker.locked and locked_at is None:
+            locked_at = true_at
+        if tracker.settled_bpm == round(true_bpm) and settled_at is None:
+            settled_at = true_at
+            settles.append(settled_at - (0.0 if true_bpm == bpm else seconds / 2))
+        if true_bpm == to_bpm and settled_at is not None and settled_at < seconds / 2:
+            settled_at = None
+        if settled_at is not None:
+            tempo_errors.append(abs(tracker.bpm - true_bpm))
+
+    print(f"Tracker, {bpm:g} -> {to_bpm:g} BPM, {jitter * 1000:.1f}ms jitter:")
+    print(f"  lock after {locked_at:.3f}s, settled after {', '.join(f'{settle:.2f}s' for settle in settles)}")
+    print(f"  tempo error once settled {percentiles(tempo_errors)} BPM")
+    print(f"  predicted grid vs source {percentiles(phase_errors)} ms")
+
+
+def bench_clock(bpm: float, seconds: float, jitter: float):
+    source = FakeMidiConnector()
+    output = TickRecordingConnector(int(seconds * bpm * TICKS_PER_BEAT / 60 * 2) + 100)
+    clock = MidiClock(follower=ClockFollower(source))
+    clock.set_bpm(round(bpm * 0.9))
+    stop_event = threading.Event()
+    clock_thread = threading.Thread(target=clock.run, args=(stop_event, output))
+    clock_thread.start()
+    time.sleep(0.1)
+
+    started_at = time.perf_counter()
+    arrivals = []
+    for _, arrival in source_ticks(bpm, bpm, seconds, jitter):
+        delay = started_at + arrival - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        source.press([0xF8])
+        arrivals.append(time.perf_counter())
+    stop_event.set()
+    clock_thread.join()
+
+    # Only once locked, the last half
+    ticks = [at for at in output.ticks[:output.count.value] if at > started_at + seconds / 2]
+    interval = 60.0 / (bpm * TICKS_PER_BEAT)
+    source_errors = [abs(later - earlier - interval) * 1000 for earlier, later in zip(arrivals, arrivals[1:])
+                     if earlier > started_at + seconds / 2 and later - earlier < interval * 1.5]
+    output_errors = [abs(later - earlier - interval) * 1000 for earlier, later in zip(ticks, ticks[1:])]
+    print(f"Clock following {bpm:g} BPM in real time, {jitter * 1000:.1f}ms jitter, settled at "
+          f"{clock.follower.settled_bpm.value} BPM:")  # type: ignore
+    print(f"  source interval error {percentiles(source_errors)} ms")
+    print(f"  output interval error {percentiles(output_errors)} ms")
+
+
+def main(argv: list[str]):
+    options = dict(arg[2:].split('=', 1) for arg in argv if arg.startswith('--'))
+    bpm = float(options.get('bpm', 120))
+    to_bpm = float(options.get('to-bpm', 126))
+    jitter = float(options.get('jitter-ms', 1.0)) / 1000
+    seconds = float(options.get('seconds', 10))
+    bench_tracker(bpm, to_bpm, 60.0, jitter)
+    bench_clock(bpm, seconds, jitter)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
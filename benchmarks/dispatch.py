@@ -0,0 +1,70 @@
+"""Per-message dispatch cost: enum construction with try/except vs. the compiled lookup table.
+
+Floods the lookup with mapped pedal presses and with unmapped traffic (aftertouch, clock echoes,
+CCs from other gear), in play and BPM mode.
+
+    PYTHONPATH=src python benchmarks/dispatch.py [--messages=200000]
+"""
+import sys
+import time
+from enum import Enum
+
+from devices import MVavePedalListener, PedalButton
+
+UNMAPPED = ([0xD0, 64], [0xF8], [0xB3, 7, 100], [0x99, 36, 0])
+
+
+def build_listener() -> MVavePedalListener:
+    pedal = MVavePedalListener(change_mode_button=PedalButton.C_PRESS)
+    noop = lambda *args: None
+    for pedal_btn in (PedalButton.A_PRESS, PedalButton.B_PRESS, PedalButton.C_RELEASE):
+        pedal.add_play_behaviour(pedal_btn, noop)
+        pedal.add_bpm_behaviour(pedal_btn, noop)
+    return pedal
+
+
+def legacy_lookup(pedal: MVavePedalListener):
+    # The previous path: build the enum from the raw bytes, catch ValueError for unmapped messages
+    # and allocate the mode-specific behaviour on every lookup
+    legacy_button = Enum('LegacyButton', {pedal_btn.name: value for pedal_btn, value in pedal.button_map.items()})
+
+    def lookup(midi_msg, is_bpm_mode):
+        try:
+            midi_btn = legacy_button((midi_msg[0], midi_msg[1] if len(midi_msg) >= 2 else -1))
+        except ValueError:
+            return None
+        pedal_btn = PedalButton[midi_btn.name]
+        if pedal_btn == pedal.change_mode_button:
+            return lambda *args: (lambda *args: None, lambda *args: None)
+        if is_bpm_mode:
+            return pedal._bpm_behaviours.get(pedal_btn)  # pylint: disable=protected-access
+        return pedal._play_behaviours.get(pedal_btn)  # pylint: disable=protected-access
+    return lookup
+
+
+def measure(lookup, messages: list[list[int]], count: int, is_bpm_mode: bool) -> float:
+    flood = (messages * (count // len(messages) + 1))[:count]
+    started = time.perf_counter()
+    for midi_msg in flood:
+        lookup(midi_msg, is_bpm_mode)
+    return (time.perf_counter() - started) / count
+
+
+def main(argv: list[str]):
+    options = dict(arg[2:].split('=', 1) for arg in argv if arg.startswith('--'))
+    count = int(options.get('messages', 200000))
+    pedal = build_listener()
+    pedal.compile_dispatch()
+    mapped = [list(value) for value in pedal.button_map.values()]
+    lookups = (("enum + try/except", legacy_lookup(pedal)), ("compiled table", pedal.lookup))
+
+    for label, messages in (("mapped", mapped), ("unmapped", list(UNMAPPED))):
+        for is_bpm_mode in (False, True):
+            mode = "bpm" if is_bpm_mode else "play"
+            for name, lookup in lookups:
+                cost = measure(lookup, messages, count, is_bpm_mode)
+                print(f"{label:>8} {mode:<4} {name:<18} {cost * 1e9:>7.0f}ns per message")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
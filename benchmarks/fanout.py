@@ -0,0 +1,80 @@
+"""Inter-port skew, jitter and CPU of the clock fan-out to several outputs with different latencies.
+
+The clock runs against fake outputs, each with a made-up device latency. A tick lands on a device at its
+send time plus that latency; the skew of a tick is the spread of its landing times over all outputs, which is
+where the error of the delayed sends shows. Jitter is that of the tick grid, on the slowest output sent first.
+The same run with a single output gives the baseline tick jitter and CPU.
+
+A last run with a fan-out tolerance wider than the latency spread sends every output in one burst, for
+comparison with the delayed sends. With --realtime=1 the benchmark is hardened like the clock worker under
+--realtime first (SCHED_FIFO needs root), which is what the plain sleeps of the delayed sends are meant for.
+The runs alternate for a few rounds and the one with the lowest p99 jitter is kept for each, so a stall of the
+machine during one run does not decide the comparison.
+
+    PYTHONPATH=src python benchmarks/fanout.py [--seconds=10] [--bpm=120] [--latencies-us=2000,500,3500]
+        [--rounds=3] [--realtime=1]
+"""
+import logging
+import sys
+import threading
+import time
+
+from app.hardening import harden, plan_hardening
+from devices.fake_connector import FakeMidiConnector
+from devices.midi_clock import FANOUT_TOLERANCE, ClockOutput, MidiClock, TICKS_PER_BEAT
+from devices.midi_output import CLOCK
+
+
+def percentiles(values: list[float]) -> str:
+    values = sorted(values)
+    return f"p50 {values[len(values) // 2]:7.1f} p99 {values[int(len(values) * 0.99)]:7.1f} max {values[-1]:7.1f}"
+
+
+def run_fanout(latencies: list[float], seconds: float, bpm: int, fanout_tolerance: float = FANOUT_TOLERANCE):
+    connectors = [FakeMidiConnector() for _ in latencies]
+    clock = MidiClock(
+        output_latency=latencies[0],
+        extra_outputs=tuple(ClockOutput(connector, latency) for connector, latency in zip(connectors[1:], latencies[1:])),
+        fanout_tolerance=fanout_tolerance)
+    clock.set_bpm(bpm)
+    stop_event = threading.Event()
+    threading.Timer(seconds, stop_event.set).start()
+    cpu_before = time.thread_time()
+    clock.run(stop_event, connectors[0])  # type: ignore
+    cpu = time.thread_time() - cpu_before
+
+    ticks = [[at for at, message in connector.sent if message == tuple(CLOCK)] for connector in connectors]
+    count = min(len(port_ticks) for port_ticks in ticks)
+    landings = [[port_ticks[tick] + latency for port_ticks, latency in zip(ticks, latencies)] for tick in range(count)]
+    skews = [(max(landing) - min(landing)) * 1e6 for landing in landings]
+    interval = 60.0 / (bpm * TICKS_PER_BEAT)
+    lead = latencies.index(max(latencies))
+    jitter = [abs(later[lead] - earlier[lead] - interval) * 1e6 for earlier, later in zip(landings, landings[1:])]
+    return skews, jitter, cpu / count * 1e6
+
+
+def main(argv: list[str]):
+    options = dict(arg[2:].split('=', 1) for arg in argv if arg.startswith('--'))
+    seconds = float(options.get('seconds', 10))
+    rounds = int(options.get('rounds', 3))
+    bpm = int(options.get('bpm', 120))
+    latencies = [int(latency) / 1e6 for latency in options.get('latencies-us', '2000,500,3500').split(',')]
+    if options.get('realtime') == '1':
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+        harden("fanout benchmark", plan_hardening()['clock'])
+
+    print(f"Clock fan-out @ {bpm} BPM, {seconds:.0f}s per run, best of {rounds} rounds (us)")
+    spread = max(latencies) - min(latencies)
+    runs = (('1 output', latencies[:1], FANOUT_TOLERANCE), (f'{len(latencies)} outputs', latencies, FANOUT_TOLERANCE),
+            ('1 burst', latencies, spread + 1e-6))
+    results: dict[str, list] = {label: [] for label, _, _ in runs}
+    for _ in range(rounds):
+        for label, run_latencies, fanout_tolerance in runs:
+            results[label].append(run_fanout(run_latencies, seconds, bpm, fanout_tolerance))
+    for label, run_results in results.items():
+        skews, jitter, cpu_per_tick = min(run_results, key=lambda result: sorted(result[1])[int(len(result[1]) * 0.99)])
+        print(f"{label:<10} skew {percentiles(skews)}   jitter {percentiles(jitter)}   CPU {cpu_per_tick:.1f}/tick")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,76 @@
+"""Worst tick interval outliers of the clock worker, with and without --realtime hardening.
+
+The clock runs in a forked worker exactly as the controller starts it, against a fake connector, while
+background processes keep every CPU busy and churn garbage. Without root the scheduling and memory
+locking parts of the hardening are refused, the log says which.
+
+    PYTHONPATH=src python benchmarks/hardening.py [--seconds=10] [--bpm=120] [--load=<cpus>] [--worst=10]
+"""
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from app.hardening import plan_hardening
+from app.mvave_drumbrute import _run_worker
+from devices.midi_clock import DEFAULT_SPIN_WINDOW, MidiClock
+from runtime_modes import TickRecordingConnector
+
+
+def churn(stop_event):
+    # Cyclic garbage, so this process and anything sharing its CPU keeps hitting the collector
+    while not stop_event.is_set():
+        nodes = [[] for _ in range(1000)]
+        for node, other in zip(nodes, nodes[1:]):
+            node.append(other)
+            other.append(node)
+
+
+def run_clock(realtime: bool, seconds: float, bpm: int, load: int) -> list[float]:
+    connector = TickRecordingConnector(int(seconds * bpm * 24 / 60 * 2) + 100)
+    clock = MidiClock(
+        spin_window=None if realtime else DEFAULT_SPIN_WINDOW, freeze_gc=realtime,
+        disable_gc=realtime and plan_hardening()['clock'].disable_gc)
+    clock.set_bpm(bpm)
+    stop_event = multiprocessing.Event()
+    burners = [multiprocessing.Process(target=churn, args=(stop_event,)) for _ in range(load)]
+    worker = multiprocessing.Process(
+        target=_run_worker, args=(clock.run, stop_event, connector), name="clock",
+        kwargs={'hardening': plan_hardening()['clock'] if realtime else None})
+
+    for burner in burners:
+        burner.start()
+    worker.start()
+    time.sleep(seconds)
+    stop_event.set()
+    for process in burners + [worker]:
+        process.join()
+
+    ticks = connector.ticks[:connector.count.value]
+    interval = 60.0 / (bpm * 24)
+    return sorted(abs(later - earlier - interval) * 1000 for earlier, later in zip(ticks, ticks[1:]))
+
+
+def main(argv: list[str]):
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    options = dict(arg[2:].split('=', 1) for arg in argv if arg.startswith('--'))
+    seconds = float(options.get('seconds', 10))
+    bpm = int(options.get('bpm', 120))
+    load = int(options.get('load', os.cpu_count() or 1))
+    worst = int(options.get('worst', 10))
+    multiprocessing.set_start_method("fork", force=True)
+
+    results = {}
+    for label, realtime in (('default', False), ('realtime', True)):
+        results[label] = run_clock(realtime, seconds, bpm, load)
+
+    print(f"Tick interval error @ {bpm} BPM, {load} loaded CPUs, {seconds:.0f}s per run")
+    for label, errors_ms in results.items():
+        print(f"{label:<9} p50 {errors_ms[len(errors_ms) // 2]:.3f}ms p99 {errors_ms[int(len(errors_ms) * 0.99)]:.3f}ms "
+              f"p99.9 {errors_ms[int(len(errors_ms) * 0.999)]:.3f}ms ({len(errors_ms)} intervals)")
+        print(f"{'':<9} worst {' '.join(f'{error:.3f}' for error in reversed(errors_ms[-worst:]))}ms")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,68 @@
+"""Press-to-send latency and idle wakeups of the pedal listener input modes.
+
+    PYTHONPATH=src python benchmarks/input_latency.py
+"""
+import statistics
+import threading
+import time
+
+from devices import MVavePedalListener, PedalButton
+from devices.fake_connector import FakeMidiConnector
+from devices.mvave_pedal import INPUT_MODES
+
+
+class CountingConnector(FakeMidiConnector):
+
+    def __init__(self):
+        super().__init__()
+        self.waits = 0
+
+    def wait_input_message(self, timeout: float | None = None):
+        self.waits += 1
+        return super().wait_input_message(timeout)
+
+
+def run_mode(input_mode: str, presses: int = 200, idle_seconds: float = 1.0):
+    connector = CountingConnector()
+    pedal = MVavePedalListener(input_mode=input_mode)
+    pedal.add_play_behaviour(
+        PedalButton.A_PRESS,
+        lambda midi_connector, *args: midi_connector.send_message([0xC9, 1]))
+
+    stop_event = threading.Event()
+    worker = threading.Thread(target=pedal.listen, args=(stop_event, connector))
+    worker.start()
+    time.sleep(0.1)
+
+    latencies = []
+    for _ in range(presses):
+        sent_before = len(connector.sent)
+        connector.press(list(pedal.button_map[PedalButton.A_PRESS]))
+        while len(connector.sent) == sent_before:
+            time.sleep(0)
+        latencies.append(connector.sent[-1][0] - connector.received[-1][0])
+        # Release in between, identical back-to-back presses are debounced
+        connector.press(list(pedal.button_map[PedalButton.A_RELEASE]))
+        time.sleep(0.005)
+
+    wakeups_before = connector.waits + connector.midi_in.polls
+    cpu_before = time.process_time()
+    time.sleep(idle_seconds)
+    idle_wakeups = connector.waits + connector.midi_in.polls - wakeups_before
+    idle_cpu = time.process_time() - cpu_before
+
+    stop_event.set()
+    worker.join()
+
+    latencies.sort()
+    print(
+        f"{input_mode:>8}: latency p50 {statistics.median(latencies) * 1000:.3f}ms "
+        f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.3f}ms "
+        f"max {latencies[-1] * 1000:.3f}ms | "
+        f"idle wakeups {idle_wakeups / idle_seconds:.0f}/s cpu {idle_cpu / idle_seconds * 100:.1f}%"
+    )
+
+
+if __name__ == '__main__':
+    for mode in INPUT_MODES:
+        run_mode(mode)
@@ -0,0 +1,100 @@
+"""Cost of the live metrics on the clock tick loop and on the listener's per-message path.
+
+The clock runs against a fake output with and without metrics enabled: CPU per tick and tick jitter. The
+listener steps through batches of pedal presses (no-op behaviours) with and without metrics: time per
+message, and with metrics the time of the publish that buckets each batch's samples, off the message path as
+it is once a second in the listener; the two alternate for a few rounds and the best round of each is kept.
+Last, the time the main process takes to render the exposition.
+
+    PYTHONPATH=src python benchmarks/metrics.py [--seconds=10] [--bpm=120] [--messages=100000] [--rounds=5]
+"""
+import sys
+import threading
+import time
+
+from app.metrics_endpoint import render
+from devices import MVavePedalListener, PedalButton
+from devices.fake_connector import FakeMidiConnector
+from devices.metrics import Metrics
+from devices.midi_clock import MidiClock, TICKS_PER_BEAT
+from devices.midi_output import CLOCK
+
+
+def percentiles(values: list[float]) -> str:
+    values = sorted(values)
+    return f"p50 {values[len(values) // 2]:6.1f} p99 {values[int(len(values) * 0.99)]:6.1f} max {values[-1]:7.1f}"
+
+
+def run_clock(with_metrics: bool, seconds: float, bpm: int) -> tuple[list[float], float, Metrics | None]:
+    connector = FakeMidiConnector()
+    clock = MidiClock()
+    metrics = clock.enable_metrics() if with_metrics else None
+    clock.set_bpm(bpm)
+    stop_event = threading.Event()
+    threading.Timer(seconds, stop_event.set).start()
+    cpu_before = time.thread_time()
+    clock.run(stop_event, connector)  # type: ignore
+    cpu = time.thread_time() - cpu_before
+
+    ticks = [at for at, message in connector.sent if message == tuple(CLOCK)]
+    interval = 60.0 / (bpm * TICKS_PER_BEAT)
+    jitter = [abs(later - earlier - interval) * 1e6 for earlier, later in zip(ticks, ticks[1:])]
+    return jitter, cpu / len(ticks) * 1e6, metrics
+
+
+def run_listener(with_metrics: bool, messages: int, batch: int = 1000) -> tuple[float, float, Metrics | None]:
+    pedal = MVavePedalListener(change_mode_button=PedalButton.C_PRESS)
+    for pedal_btn in (PedalButton.A_PRESS, PedalButton.B_PRESS, PedalButton.C_RELEASE):
+        pedal.add_play_behaviour(pedal_btn, lambda *args: None)
+        pedal.add_bpm_behaviour(pedal_btn, lambda *args: None)
+    metrics = pedal.enable_metrics() if with_metrics else None
+    connector = FakeMidiConnector()
+    pedal._begin(connector)  # type: ignore  # pylint: disable=protected-access
+    # Alternating buttons, so none of them is dropped as a duplicate
+    presses = [(list(pedal.button_map[pedal_btn]), 0.05) for pedal_btn in (PedalButton.A_PRESS, PedalButton.B_PRESS)]
+    elapsed = publishing = 0.0
+    for first in range(0, messages, batch):
+        started = time.perf_counter()
+        for number in range(first, first + batch):
+            pedal._step(connector, presses[number % 2])  # type: ignore  # pylint: disable=protected-access
+        elapsed += time.perf_counter() - started
+        if metrics is not None:
+            started = time.perf_counter()
+            metrics.publish()
+            publishing += time.perf_counter() - started
+    pedal._end(connector)  # type: ignore  # pylint: disable=protected-access
+    return elapsed / messages * 1e9, publishing / (messages // batch) * 1e6, metrics
+
+
+def main(argv: list[str]):
+    options = dict(arg[2:].split('=', 1) for arg in argv if arg.startswith('--'))
+    seconds = float(options.get('seconds', 10))
+    bpm = int(options.get('bpm', 120))
+    messages = int(options.get('messages', 100000))
+    rounds = int(options.get('rounds', 5))
+
+    print(f"Clock @ {bpm} BPM, {seconds:.0f}s per run, tick jitter and CPU (us)")
+    blocks = []
+    for label, with_metrics in (('no metrics', False), ('metrics', True)):
+        jitter, cpu_per_tick, metrics = run_clock(with_metrics, seconds, bpm)
+        print(f"  {label:<12} jitter {percentiles(jitter)}   CPU {cpu_per_tick:.1f}/tick")
+        blocks += [metrics] if metrics else []
+
+    print(f"Listener, {messages} pedal presses in batches of 1000, best of {rounds} rounds")
+    results: dict[bool, list] = {False: [], True: []}
+    for _ in range(rounds):
+        for with_metrics in (False, True):
+            results[with_metrics].append(run_listener(with_metrics, messages))
+    for label, with_metrics in (('no metrics', False), ('metrics', True)):
+        per_message, per_publish, metrics = min(results[with_metrics], key=lambda result: result[0])
+        print(f"  {label:<12} {per_message:8.0f}ns per message" +
+              (f", {per_publish:.0f}us per publish" if with_metrics else ''))
+        blocks += [metrics] if metrics else []
+
+    started = time.perf_counter()
+    text = render(blocks)
+    print(f"Exposition: {len(text)} bytes rendered in {(time.perf_counter() - started) * 1000:.2f}ms")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,65 @@
+"""Bytes on the wire and send cost: padded three-byte lists vs. prebuilt, correctly sized buffers.
+
+The workload is one minute of clock at 300 BPM plus a start, a stop and a bank and program change
+for each of the 64 patterns.
+
+    PYTHONPATH=src python benchmarks/midi_output.py
+"""
+import time
+
+from devices import Drumbrute
+from devices.fake_connector import FakeMidiConnector
+from devices.midi_output import CLOCK
+
+TICKS = 300 * 24
+
+
+class ByteCountingConnector(FakeMidiConnector):
+
+    @property
+    def bytes_sent(self) -> int:
+        return sum(len(message) for _, message in self.sent)
+
+
+def legacy_workload(connector: FakeMidiConnector, drumbrute: Drumbrute):
+    midi_out = connector.midi_out
+    channel = drumbrute.channel - 1
+    midi_out.send_message([drumbrute.START, 255, 255])
+    for tick in range(TICKS):
+        midi_out.send_message([0xF8, 255, 255])
+        if tick % 100 == 0:
+            pattern_num = tick // 100 % 64
+            midi_out.send_message([drumbrute.CC + channel, 0, pattern_num // 16])
+            midi_out.send_message([drumbrute.PC + channel, 0, pattern_num % 16])
+    midi_out.send_message([drumbrute.STOP, 255, 255])
+
+
+def writer_workload(connector: FakeMidiConnector, drumbrute: Drumbrute):
+    drumbrute.play(connector)
+    for tick in range(TICKS):
+        connector.send_realtime(CLOCK)
+        if tick % 100 == 0:
+            pattern_num = tick // 100 % 64
+            drumbrute.change_bank(connector, pattern_num // 16)
+            drumbrute.change_pattern(connector, pattern_num % 16)
+    drumbrute.stop(connector)
+
+
+def measure(label: str, workload, running_status: bool = False):
+    connector = ByteCountingConnector()
+    connector.running_status = running_status
+    started = time.perf_counter()
+    workload(connector, Drumbrute())
+    elapsed = time.perf_counter() - started
+    messages = len(connector.sent)
+    # 10 bits per byte on a 31250 baud DIN link
+    wire_seconds = connector.bytes_sent * 10 / 31250
+    print(f"{label:<28} {messages:>6} messages {connector.bytes_sent:>6} bytes "
+          f"({wire_seconds / 60 * 100:.1f}% of the DIN link) "
+          f"{elapsed / messages * 1e6:.2f}us per send")
+
+
+if __name__ == '__main__':
+    measure("padded lists", legacy_workload)
+    measure("prebuilt buffers", writer_workload)
+    measure("prebuilt + running status", writer_workload, running_status=True)
@@ -0,0 +1,151 @@
+"""Replay a recorded pedal session through the listener, the behaviours and the clock.
+
+Reports press-to-output latency percentiles, where pattern switches land in the bar, the clock
+tick-interval jitter histogram, CPU time and StateStore operation counts. Needs no MIDI hardware.
+
+    PYTHONPATH=src python benchmarks/replay.py [session.jsonl] [--clock-seconds=5] [--bpm=300] \
+        [--pattern-quantize=bar] [--lead-ticks=0]
+"""
+import io
+import os
+import sys
+import threading
+import time
+
+from app.actions import BehaviorController
+from app.display import StatusDisplay
+from app.shared_state import SharedState
+from app.side_effects import SideEffectQueue
+from devices import Drumbrute, MidiClock, MVavePedalListener, PedalButton
+from devices.fake_connector import FakeMidiConnector
+from devices.midi_clock import CLOCK_TICK_CMD, TICKS_PER_BEAT
+from devices.sessions import load_session
+from state_store_ops import count_ops
+
+DEFAULT_SESSION = os.path.join(os.path.dirname(__file__), 'sessions', 'gig.jsonl')
+JITTER_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, float('inf'))
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def build_listener(connector: FakeMidiConnector, clock: MidiClock):
+    drumbrute = Drumbrute()
+    state = SharedState(drumbrute.max_patterns * drumbrute.max_banks)
+    actions = BehaviorController(
+        drumbrute, state, clock, StatusDisplay(output=io.StringIO()), SideEffectQueue())
+    pedal = MVavePedalListener(change_mode_threshold=3)
+    pedal.on_start(actions.on_start_behaviour)
+    pedal.on_change_mode(actions.on_change_mode_behaviour)
+    pedal.on_press_change_button(actions.on_press_change_mode_button_behaviour)
+    pedal.add_play_behaviour(PedalButton.A_PRESS, actions.toggle_play_behaviour)
+    pedal.add_play_behaviour(PedalButton.B_PRESS, actions.previous_pattern_behaviour)
+    pedal.add_play_behaviour(PedalButton.C_RELEASE, actions.next_pattern_behaviour)
+    pedal.add_bpm_behaviour(PedalButton.A_PRESS, actions.decrease_bpm_behaviour)
+    pedal.add_bpm_behaviour(PedalButton.B_PRESS, actions.increase_bpm_behaviour)
+    pedal.add_bpm_behaviour(PedalButton.C_RELEASE, actions.show_enter_bpm_mode_behaviour)
+    return pedal
+
+
+def bench_listener(session_path: str, pattern_quantize: str, lead_ticks: int):
+    connector = FakeMidiConnector()
+    clock = MidiClock(
+        report_interval=3600, device=Drumbrute(), pattern_quantize=pattern_quantize, lead_ticks=lead_ticks)
+    pedal = build_listener(connector, clock)
+    stop_event = threading.Event()
+    workers = [
+        threading.Thread(target=pedal.listen, args=(stop_event, connector)),
+        threading.Thread(target=clock.run, args=(stop_event, connector)),
+    ]
+    for worker in workers:
+        worker.start()
+    time.sleep(0.1)
+    sent_at_start = len(connector.sent)
+
+    cpu_before = time.process_time()
+    connector.replay(load_session(session_path))
+    time.sleep(0.1)
+    cpu = time.process_time() - cpu_before
+    stop_event.set()
+    for worker in workers:
+        worker.join()
+
+    sent = connector.sent[sent_at_start:]
+    outputs = [(sent_at, message) for sent_at, message in sent if message[0] != CLOCK_TICK_CMD]
+    latencies = []
+    for index, (pressed_at, _) in enumerate(connector.received):
+        next_press = connector.received[index + 1][0] if index + 1 < len(connector.received) else float('inf')
+        first_output = next((sent_at for sent_at, _ in outputs if pressed_at <= sent_at < next_press), None)
+        if first_output is not None:
+            latencies.append(first_output - pressed_at)
+
+    # Song position of every program change, counted in ticks since the last START
+    bar_ticks = TICKS_PER_BEAT * clock.beats_per_bar
+    position, landings = 0, []
+    for _, message in connector.sent:
+        if message[0] == CLOCK_TICK_CMD:
+            position += 1
+        elif message[0] == Drumbrute.START:
+            position = 0
+        elif message[0] & 0xF0 == Drumbrute.PC:
+            landings.append(position % bar_ticks)
+
+    print(f"listener: {len(connector.received)} messages in, {len(outputs)} out, cpu {cpu * 1000:.1f}ms")
+    if latencies:
+        print("  press-to-output " + " ".join(
+            f"p{int(fraction * 100)} {percentile(latencies, fraction) * 1000:.3f}ms"
+            for fraction in (0.5, 0.9, 0.99, 1.0)))
+    if landings:
+        print(f"  pattern switches ({pattern_quantize}, lead {lead_ticks} ticks) at bar tick: " + " ".join(
+            f"{tick}x{landings.count(tick)}" for tick in sorted(set(landings))))
+
+
+def bench_clock(bpm: int, seconds: float):
+    connector = FakeMidiConnector()
+    clock = MidiClock(report_interval=3600)
+    clock.set_bpm(bpm)
+    stop_event = threading.Event()
+    worker = threading.Thread(target=clock.run, args=(stop_event, connector))
+
+    cpu_before = time.process_time()
+    worker.start()
+    time.sleep(seconds)
+    stop_event.set()
+    worker.join()
+    cpu = time.process_time() - cpu_before
+
+    ticks = [sent_at for sent_at, message in connector.sent if message[0] == CLOCK_TICK_CMD]
+    interval = MidiClock.tick_interval(bpm)
+    errors_ms = [abs(later - earlier - interval) * 1000 for earlier, later in zip(ticks, ticks[1:])]
+    print(f"clock @ {bpm} BPM: {len(ticks)} ticks in {seconds:.1f}s, cpu {cpu / seconds * 100:.1f}% of one core")
+    print(f"  jitter p50 {percentile(errors_ms, 0.5):.3f}ms p99 {percentile(errors_ms, 0.99):.3f}ms "
+          f"max {max(errors_ms):.3f}ms")
+    lower = 0.0
+    for upper in JITTER_BUCKETS_MS:
+        count = sum(1 for error in errors_ms if lower <= error < upper)
+        bar = '#' * round(count / len(errors_ms) * 50)
+        print(f"  {lower:>5.2f}-{upper:<5.2f}ms {count:>6} {bar}")
+        lower = upper
+
+
+def bench_state_store():
+    print("state store operations per press:")
+    for name, ops in count_ops(shared=True).items():
+        print(f"  {name:<28} " + " ".join(f"{op}:{count:.2f}" for op, count in sorted(ops.items())))
+
+
+def main(argv: list[str]):
+    options = dict(arg[2:].split('=', 1) for arg in argv if arg.startswith('--'))
+    paths = [arg for arg in argv if not arg.startswith('--')]
+    bench_listener(
+        paths[0] if paths else DEFAULT_SESSION,
+        options.get('pattern-quantize', 'bar'),
+        int(options.get('lead-ticks', 0)))
+    bench_clock(int(options.get('bpm', 300)), float(options.get('clock-seconds', 5)))
+    bench_state_store()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,116 @@
+"""Resident memory, CPU and clock jitter of the multiprocessing and the asyncio + clock thread runtimes.
+
+Each runtime runs the whole controller against a fake MIDI connector in a fresh interpreter for a few
+seconds. Memory is summed over the main process and its workers; PSS splits pages shared after the
+fork between the processes, so it is the number to compare.
+
+    PYTHONPATH=src python benchmarks/runtime_modes.py [--seconds=10] [--bpm=120]
+"""
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import active_children
+from multiprocessing.sharedctypes import RawArray, RawValue
+
+from app import mvave_drumbrute
+from app.data import StateStore
+from devices.fake_connector import FakeMidiConnector
+from devices.midi_output import CLOCK
+
+
+class TickRecordingConnector(FakeMidiConnector):
+    # Tick send times go to shared memory, so they are visible from whichever process runs the clock
+
+    def __init__(self, capacity: int):
+        super().__init__()
+        self.ticks = RawArray('d', capacity)
+        self.count = RawValue('l', 0)
+
+    def send_realtime(self, message: bytes):
+        super().send_realtime(message)
+        if message == CLOCK and self.count.value < len(self.ticks):
+            self.ticks[self.count.value] = time.perf_counter()
+            self.count.value += 1
+
+
+def memory_kb(pid: int) -> tuple[int, int]:
+    rss = pss = 0
+    with open(f'/proc/{pid}/status', encoding='ascii') as status_file:
+        for line in status_file:
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1])
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', encoding='ascii') as smaps_file:
+            for line in smaps_file:
+                if line.startswith('Pss:'):
+                    pss = int(line.split()[1])
+    except OSError:
+        pss = rss
+    return rss, pss
+
+
+def run_runtime(runtime: str, seconds: float, bpm: int) -> dict:
+    connector = TickRecordingConnector(int(seconds * bpm * 24 / 60 * 2) + 100)
+    memory = {}
+
+    def sample_and_stop():
+        time.sleep(seconds)
+        pids = [os.getpid()] + [child.pid for child in active_children()]
+        samples = [memory_kb(pid) for pid in pids]  # type: ignore
+        memory.update(processes=len(pids), rss=sum(rss for rss, _ in samples), pss=sum(pss for _, pss in samples))
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = StateStore(os.path.join(tmp_dir, 'state.db'))
+        store.set_pattern_bpm(0, bpm)
+        threading.Thread(target=sample_and_stop, daemon=True).start()
+        cpu_before = os.times()
+        mvave_drumbrute.run(connector, store, runtime=runtime)
+        cpu_after = os.times()
+
+    cpu = sum(after - before for after, before in zip(cpu_after[:4], cpu_before[:4]))
+    ticks = connector.ticks[:connector.count.value]
+    interval = 60.0 / (bpm * 24)
+    errors_ms = sorted(abs(later - earlier - interval) * 1000 for earlier, later in zip(ticks, ticks[1:]))
+    return dict(
+        memory,
+        cpu_percent=cpu / seconds * 100,
+        ticks=len(ticks),
+        jitter_p50=errors_ms[len(errors_ms) // 2],
+        jitter_p99=errors_ms[int(len(errors_ms) * 0.99)],
+        jitter_max=errors_ms[-1],
+    )
+
+
+def main(argv: list[str]):
+    options = dict(arg[2:].split('=', 1) for arg in argv if arg.startswith('--'))
+    seconds = float(options.get('seconds', 10))
+    bpm = int(options.get('bpm', 120))
+
+    if 'runtime' in options:
+        # Child run: keep the status display off the terminal, report on the original stdout
+        report = os.fdopen(os.dup(1), 'w')
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        report.write(json.dumps(run_runtime(options['runtime'], seconds, bpm)) + '\n')
+        report.flush()
+        return
+
+    print(f"{'runtime':<10} {'procs':>5} {'RSS':>9} {'PSS':>9} {'CPU':>6}   clock jitter @ {bpm} BPM")
+    for runtime in mvave_drumbrute.RUNTIMES:
+        child = subprocess.run(
+            [sys.executable, __file__, f'--runtime={runtime}', f'--seconds={seconds}', f'--bpm={bpm}'],
+            capture_output=True, text=True, check=True)
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        print(f"{runtime:<10} {result['processes']:>5} {result['rss'] / 1024:>7.1f}MB {result['pss'] / 1024:>7.1f}MB "
+              f"{result['cpu_percent']:>5.1f}%   p50 {result['jitter_p50']:.3f}ms p99 {result['jitter_p99']:.3f}ms "
+              f"max {result['jitter_max']:.3f}ms ({result['ticks']} ticks)")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,118 @@
+"""Song changes through a setlist against the same changes made with single-step pedal presses.
+
+A random set of songs (pattern, BPM, play) is gone through twice with the clock running: once pressing
+next/previous pattern, +/-1 BPM and play until each song is reached, as without a setlist, and once with a
+single setlist jump per song. Reports per song change the pedal presses, clock control and shared state
+writes, display updates, messages sent to the device besides the clock, and the time spent in behaviours.
+
+    PYTHONPATH=src python benchmarks/setlist.py [--songs=8] [--press-interval-ms=25] [--pattern-quantize=tick]
+"""
+import io
+import random
+import sys
+import threading
+import time
+
+from app.actions import BehaviorController
+from app.display import StatusDisplay
+from app.setlist import Setlist, SetlistStep
+from app.shared_state import SharedState
+from devices import Drumbrute, MidiClock
+from devices.fake_connector import FakeMidiConnector
+from devices.midi_clock import CLOCK_TICK_CMD
+
+
+class CountingSideEffects():
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, key, *args, **kwargs):
+        self.submitted += 1
+
+
+def random_setlist(songs: int, device: Drumbrute, seed: int = 1) -> Setlist:
+    rng = random.Random(seed)
+    steps = [SetlistStep(rng.randrange(device.num_patterns), rng.randrange(80, 170), 0, int(rng.random() < 0.8))
+             for _ in range(songs)]
+    return Setlist([f"song {number}" for number in range(1, songs + 1)], steps)
+
+
+def single_step_presses(actions: BehaviorController, step: SetlistStep) -> list:
+    # The presses it takes without a setlist, each one applied before the next is chosen
+    state = actions.state
+    if state.pattern != step.pattern:
+        return [actions.next_pattern_behaviour if state.pattern < step.pattern else actions.previous_pattern_behaviour]
+    if state.bpm != step.bpm:
+        return [actions.increase_bpm_behaviour if state.bpm < step.bpm else actions.decrease_bpm_behaviour]
+    if state.playing != bool(step.playing):
+        return [actions.toggle_play_behaviour]
+    return []
+
+
+def run_set(setlist: Setlist, use_setlist: bool, press_interval: float, pattern_quantize: str) -> dict:
+    device = Drumbrute()
+    connector = FakeMidiConnector()
+    clock = MidiClock(report_interval=3600, device=device, pattern_quantize=pattern_quantize)
+    state = SharedState(device.num_patterns)
+    side_effects = CountingSideEffects()
+    actions = BehaviorController(
+        device, state, clock, StatusDisplay(output=io.StringIO()), side_effects,  # type: ignore
+        setlist=setlist if use_setlist else None)
+    actions.on_start_behaviour(connector, [], 0.0, False)  # type: ignore
+    # From before the first song, whatever song the start pattern belongs to
+    actions.song = -1
+    stop_event = threading.Event()
+    clock_thread = threading.Thread(target=clock.run, args=(stop_event, connector))
+    clock_thread.start()
+    time.sleep(0.1)
+
+    sent_before, control_before, state_before = len(connector.sent), clock.control.version, state.version
+    presses, behaviour_time = 0, 0.0
+    for song in range(len(setlist)):
+        step = setlist.step(song)
+        while True:
+            if use_setlist:
+                behaviours = [actions.next_song_behaviour] if actions.song < song else []
+            else:
+                behaviours = single_step_presses(actions, step)
+            if not behaviours:
+                break
+            started = time.perf_counter()
+            behaviours[0](connector, [], 0.0, False)
+            behaviour_time += time.perf_counter() - started
+            presses += 1
+            time.sleep(press_interval)
+    time.sleep(0.1)
+    stop_event.set()
+    clock_thread.join()
+
+    songs = len(setlist)
+    return {
+        'presses': presses / songs,
+        'clock writes': (clock.control.version - control_before) / 2 / songs,
+        'state writes': (state.version - state_before) / 2 / songs,
+        'display updates': side_effects.submitted / songs,
+        'device messages': sum(1 for _, message in connector.sent[sent_before:] if message[0] != CLOCK_TICK_CMD) / songs,
+        'behaviour us': behaviour_time / songs * 1e6,
+    }
+
+
+def main(argv: list[str]):
+    options = dict(arg[2:].split('=', 1) for arg in argv if arg.startswith('--'))
+    songs = int(options.get('songs', 8))
+    press_interval = float(options.get('press-interval-ms', 25)) / 1000
+    pattern_quantize = options.get('pattern-quantize', 'tick')
+    setlist = random_setlist(songs, Drumbrute())
+
+    print(f"{songs} song changes, a press every {press_interval * 1000:g}ms, {pattern_quantize} pattern quantize "
+          "(per song change)")
+    results = {label: run_set(setlist, use_setlist, press_interval, pattern_quantize)
+               for label, use_setlist in (('single steps', False), ('setlist', True))}
+    print(f"{'':<16}" + "".join(f"{label:>14}" for label in results))
+    for metric in results['setlist']:
+        print(f"{metric:<16}" + "".join(f"{result[metric]:>14.1f}" for result in results.values()))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,185 @@
+"""Write amplification and power-cut recovery of the A/B slot state file.
+
+Write amplification: bytes the process hands to the kernel and syncs per persisted state change, for the
+slot file and for a dbm store written the way the previous StateStore did (the first dbm module available,
+gdbm on the device). Power cut: the write of the next slot is cut after every 16 bytes, or the slot is
+scrambled as a half-programmed flash page would be, and the file is opened again; it must come back with
+either the previous or the new state, never anything else; a file cut while it was being created (empty or
+short) must open with the defaults. Last, a writer process is SIGKILLed at random points and the state it left
+must be one it wrote. Exits non-zero on any failure.
+
+    PYTHONPATH=src python benchmarks/state_file.py [--changes=500] [--kills=20]
+"""
+import dbm
+import logging
+import os
+import random
+import signal
+import sys
+import tempfile
+import time
+
+from app.data import SLOT_SIZE, StateStore
+
+
+def io_counters() -> dict[str, int]:
+    with open('/proc/self/io', encoding='utf-8') as io_file:
+        return {name: int(value) for name, value in (line.split(': ') for line in io_file)}
+
+
+def gig_changes(changes: int, seed: int = 1):
+    # What the persist loop sees during a gig: pattern switches and tempo nudges
+    rng = random.Random(seed)
+    pattern = 0
+    for _ in range(changes):
+        if rng.random() < 0.5:
+            pattern = rng.randrange(64)
+            yield 'last_pattern', pattern
+        else:
+            yield f'last_bpm_{pattern}', rng.randrange(80, 170)
+
+
+def bench_dbm(path: str, changes: int) -> tuple[float, int]:
+    db = dbm.open(path, 'c')
+    before = io_counters()
+    for key, value in gig_changes(changes):
+        db[key.encode()] = str(value).encode()
+        if hasattr(db, 'sync'):
+            db.sync()
+    written = io_counters()['wchar'] - before['wchar']
+    db.close()
+    size = sum(os.path.getsize(os.path.join(os.path.dirname(path), name))
+               for name in os.listdir(os.path.dirname(path)) if name.startswith(os.path.basename(path)))
+    return written / changes, size
+
+
+def bench_slot_file(path: str, changes: int) -> tuple[float, int]:
+    store = StateStore(path, flush_interval=3600)
+    before = io_counters()
+    for key, value in gig_changes(changes):
+        if key == 'last_pattern':
+            store.set_pattern(value)
+        else:
+            store.set_bpm(value)
+        store.flush()
+    written = io_counters()['wchar'] - before['wchar']
+    store.close()
+    return written / changes, os.path.getsize(path)
+
+
+def snapshot(path: str) -> tuple:
+    store = StateStore(path, flush_interval=3600)
+    state = (store.input_port, store.output_port, store.pattern, store.playing,
+             tuple(store.pattern_bpm(pattern) for pattern in range(128)))
+    store.close()
+    return state
+
+
+def write_image(path: str, image: bytes):
+    with open(path, 'wb') as state_file:
+        state_file.write(image)
+
+
+def bench_torn_writes(tmp_dir: str, rounds: int = 8) -> tuple[int, int]:
+    path = os.path.join(tmp_dir, 'torn.state')
+    probe = os.path.join(tmp_dir, 'probe.state')
+    rng = random.Random(2)
+    store = StateStore(path, flush_interval=3600)
+    checks = failures = 0
+    for round_number in range(rounds):
+        store.set_input_port(round_number)
+        store.set_pattern(rng.randrange(64))
+        store.set_bpm(rng.randrange(80, 170))
+        store.set_playing(bool(round_number % 2))
+        with open(path, 'rb') as state_file:
+            before = state_file.read()
+        store.flush()
+        with open(path, 'rb') as state_file:
+            after = state_file.read()
+        write_image(probe, before)
+        old_state = snapshot(probe)
+        write_image(probe, after)
+        new_state = snapshot(probe)
+
+        slot = next(index for index in range(len(after) // SLOT_SIZE)
+                    if before[index * SLOT_SIZE:(index + 1) * SLOT_SIZE] != after[index * SLOT_SIZE:(index + 1) * SLOT_SIZE])
+        start = slot * SLOT_SIZE
+        images = [before[:start] + after[start:start + cut] + before[start + cut:] for cut in range(0, SLOT_SIZE, 16)]
+        images.append(before[:start] + rng.randbytes(SLOT_SIZE) + before[start + SLOT_SIZE:])
+        for image in images:
+            write_image(probe, image)
+            checks += 1
+            failures += snapshot(probe) not in (old_state, new_state)
+        write_image(probe, after)
+        checks += 1
+        failures += snapshot(probe) != new_state
+    store.close()
+    return checks, failures
+
+
+def bench_created_files(tmp_dir: str) -> tuple[int, int]:
+    # Power cut between creating the file and its first synced write
+    path = os.path.join(tmp_dir, 'created.state')
+    defaults = snapshot(os.path.join(tmp_dir, 'defaults.state'))
+    failures = 0
+    sizes = (0, 16, SLOT_SIZE, 2 * SLOT_SIZE - 1)
+    for size in sizes:
+        write_image(path, bytes(size))
+        try:
+            failures += snapshot(path) != defaults
+        except ValueError:
+            failures += 1
+    return len(sizes), failures
+
+
+def bench_kills(tmp_dir: str, kills: int) -> tuple[int, int]:
+    path = os.path.join(tmp_dir, 'killed.state')
+    rng = random.Random(3)
+    failures = 0
+    for _ in range(kills):
+        pid = os.fork()
+        if pid == 0:
+            # Every state written has its pattern, tempo and transport derived from one counter
+            store = StateStore(path, flush_interval=3600)
+            counter = store.input_port or 0
+            while True:
+                counter += 1
+                store.set_input_port(counter)
+                store.set_pattern(counter % 64)
+                store.set_bpm(60 + counter % 200)
+                store.set_playing(bool(counter % 2))
+                store.flush()
+        time.sleep(rng.uniform(0.01, 0.05))
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        input_port, _, pattern, playing, bpm_table = snapshot(path)
+        failures += input_port is None or pattern != input_port % 64 or \
+            bpm_table[pattern] != 60 + input_port % 200 or playing != bool(input_port % 2)
+    return kills, failures
+
+
+def main(argv: list[str]) -> int:
+    options = dict(arg[2:].split('=', 1) for arg in argv if arg.startswith('--'))
+    changes = int(options.get('changes', 500))
+    kills = int(options.get('kills', 20))
+    # Cuts before the first write complete leave no valid slot, which is logged on open
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"Write amplification, {changes} persisted changes:")
+        dbm_bytes, dbm_size = bench_dbm(os.path.join(tmp_dir, 'legacy.db'), changes)
+        slot_bytes, slot_size = bench_slot_file(os.path.join(tmp_dir, 'slots.state'), changes)
+        print(f"  {dbm.whichdb(os.path.join(tmp_dir, 'legacy.db')):<10} {dbm_bytes:8.0f} bytes written per change, "
+              f"file {dbm_size} bytes")
+        print(f"  {'slot file':<10} {slot_bytes:8.0f} bytes written per change, file {slot_size} bytes")
+
+        checks, torn_failures = bench_torn_writes(tmp_dir)
+        print(f"Power cut during a slot write: {checks} cut points, {torn_failures} recovered to a state never written")
+        checks, created_failures = bench_created_files(tmp_dir)
+        print(f"Power cut while creating the file: {checks} cut points, {created_failures} not opened with defaults")
+        kills, kill_failures = bench_kills(tmp_dir, kills)
+        print(f"Writer killed: {kills} kills, {kill_failures} inconsistent states")
+    return 1 if torn_failures or created_failures or kill_failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
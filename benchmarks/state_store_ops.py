@@ -0,0 +1,143 @@
+"""Storage operations per pedal behaviour: shared state persisted through the StateStore slot file
+vs. behaviours reading and writing a dbm file directly, as before.
+
+    PYTHONPATH=src python benchmarks/state_store_ops.py
+"""
+import dbm.dumb
+import io
+import os
+import tempfile
+from collections import Counter
+from types import SimpleNamespace
+
+from app.actions import BehaviorController
+from app.data import StateStore
+from app.display import StatusDisplay
+from app.side_effects import SideEffectQueue
+from app.shared_state import SharedState
+from devices import Drumbrute, MidiClock
+from devices.midi_clock import DEFAULT_BPM
+
+
+class CountingDb():
+
+    def __init__(self, db):
+        self._db = db
+        self.ops = Counter()
+
+    def get(self, key, default=None):
+        self.ops['get'] += 1
+        return self._db.get(key, default)
+
+    def __setitem__(self, key, value):
+        self.ops['set'] += 1
+        self._db[key] = value
+
+    def sync(self):
+        self.ops['sync'] += 1
+        self._db.sync()
+
+    def close(self):
+        self._db.close()
+
+
+class DirectStateStore():
+    # Every read and write goes straight to dbm, like the store did before caching
+
+    def __init__(self, db_file_path: str):
+        self._db = dbm.dumb.open(db_file_path, 'c')
+
+    def close(self):
+        self._db.close()
+
+    def flush(self):
+        self._db.sync()
+
+    def _get(self, key: str, default: int) -> int:
+        raw_value = self._db.get(key.encode())
+        return default if raw_value is None else int(raw_value.decode())
+
+    def _set(self, key: str, value):
+        self._db[key.encode()] = str(value).encode()
+
+    @property
+    def pattern(self) -> int:
+        return self._get("last_pattern", 0)
+
+    def set_pattern(self, pattern: int):
+        self._set("last_pattern", pattern)
+
+    @property
+    def bpm(self) -> int:
+        return self._get(f"last_bpm_{self.pattern}", DEFAULT_BPM)
+
+    def set_bpm(self, bpm: int):
+        self._set(f"last_bpm_{self.pattern}", bpm)
+
+    @property
+    def playing(self) -> bool:
+        return bool(self._get("playing", 0))
+
+    def set_playing(self, playing: bool):
+        self._set("playing", int(playing))
+
+    def set_mode(self, mode: int):
+        pass
+
+    def snapshot(self):
+        return SimpleNamespace(pattern=self.pattern, playing=self.playing, bpm=self.bpm)
+
+
+class NullConnector():
+
+    def send_message(self, message):
+        pass
+
+
+BEHAVIOURS = (
+    'next_pattern_behaviour',
+    'previous_pattern_behaviour',
+    'increase_bpm_behaviour',
+    'decrease_bpm_behaviour',
+    'toggle_play_behaviour',
+)
+
+
+def count_ops(shared: bool, presses: int = 50) -> dict[str, Counter]:
+    results = {}
+    drumbrute = Drumbrute()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'state.db')
+        store = StateStore(path, flush_interval=3600) if shared else DirectStateStore(path)
+        state = SharedState.from_store(store, drumbrute.num_patterns) if shared else store  # type: ignore
+        counting_db = None if shared else CountingDb(store._db)  # type: ignore
+        if counting_db is not None:
+            store._db = counting_db  # type: ignore
+        display = StatusDisplay(output=io.StringIO())
+        actions = BehaviorController(drumbrute, state, MidiClock(), display, SideEffectQueue())  # type: ignore
+        connector = NullConnector()
+
+        for name in BEHAVIOURS:
+            ops = counting_db.ops if counting_db is not None else Counter()
+            ops.clear()
+            writes = store.writes if shared else 0  # type: ignore
+            for _ in range(presses):
+                getattr(actions, name)(connector, [], 0.0, False)
+                if shared:
+                    # Worst case: the owner persists after every single press
+                    state.persist(store)  # type: ignore
+                    store.flush()
+            store.flush()
+            if shared:
+                # Each one a whole-slot write and a sync
+                ops['slot write'] = store.writes - writes  # type: ignore
+            results[name] = Counter({op: count / presses for op, count in ops.items()})
+        store.close()
+    return results
+
+
+if __name__ == '__main__':
+    for shared in (False, True):
+        print("shared state + slot file" if shared else "direct dbm")
+        for name, ops in count_ops(shared).items():
+            print(f"  {name:<28} " + " ".join(f"{op}:{count:.2f}" for op, count in sorted(ops.items())))
@@ -1,13 +1,12 @@
-from functools import cache
+import logging
 
-from devices import MidiInOutConnector, Drumbrute, MidiClock
-from app.data import StateStore
-import pyfiglet
-
-
-@cache
-def render(text, font):
-    return pyfiglet.figlet_format(text, font=font, width=80)
+from devices import MidiInOutConnector, DeviceProfile, MidiClock
+from devices.sessions import SessionRecorder
+from app.display import StatusDisplay
+from app.setlist import Setlist
+from app.side_effects import SideEffectQueue, DROP_NEWEST
+from app.shared_state import SharedState, MODE_BPM, MODE_PLAY
+from app.tap_tempo import TapTempo
 
 
 class BehaviorController():
@@ -15,91 +14,133 @@ class BehaviorController():
 
     def __init__(
         self,
-        drumbrute: Drumbrute,
-        state_store: StateStore,
+        device: DeviceProfile,
+        state: SharedState,
         midi_clock: MidiClock,
+        display: StatusDisplay,
+        side_effects: SideEffectQueue,
         max_bpm: int = 300,
+        tap_ramp_beats: int = 4,
+        session_recorder: SessionRecorder | None = None,
+        setlist: Setlist | None = None,
     ):
-        self.drumbrute = drumbrute
-        self.state_store = state_store
+        self.device = device
+        self.state = state
         self.midi_clock = midi_clock
+        self.display = display
+        self.side_effects = side_effects
         self.max_bpm = max_bpm
+        self.tap_tempo = TapTempo()
+        self.tap_ramp_beats = tap_ramp_beats
+        self.session_recorder = session_recorder
+        self.setlist = setlist
+        self.song = -1
 
         self.change_mode_start = None
 
     def on_start_behaviour(self, midi_connector: MidiInOutConnector, midi_msg, delta, is_bpm_mode: bool):
-        self._change_pattern(midi_connector, self.state_store.pattern)
-        self._update_bpm(self.state_store.bpm)
-        if self.state_store.playing:
-            self.drumbrute.play(midi_connector)
-        else:
-            self.drumbrute.stop(midi_connector)
+        self._change_pattern(midi_connector, self.state.pattern)
+        self._update_bpm(self.state.bpm)
+        self.midi_clock.set_playing(self.state.playing)
+        if self.setlist is not None:
+            self.song = self.setlist.find(self.state.pattern)
         self._print_status(is_bpm_mode=is_bpm_mode)
 
+    def on_stop_behaviour(self, midi_connector: MidiInOutConnector, midi_msg, delta, is_bpm_mode: bool):
+        # Whatever the last record job did not get to
+        if self.session_recorder is not None:
+            self.session_recorder.write()
+
     def on_change_mode_behaviour(self, midi_connector: MidiInOutConnector, midi_msg, delta, is_bpm_mode: bool):
         self._print_status(is_bpm_mode=is_bpm_mode)
 
     def on_press_change_mode_button_behaviour(self):
-        print("PRESSED CHANGE MODE BUTTON", flush=True)
+        self.side_effects.submit("display_message", self.display.show_message, "PRESSED CHANGE MODE BUTTON")
+
+    def on_event_behaviour(self, midi_connector: MidiInOutConnector, midi_msg, delta, is_bpm_mode: bool):
+        if self.session_recorder is not None:
+            # Buffered by the recorder, the job only writes out what is there: a job replaced or dropped from
+            # the queue leaves its events to the next one
+            self.session_recorder.add(midi_msg[0], midi_connector.last_event_at)
+            self.side_effects.submit("record", self.session_recorder.write, coalesce=True)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            self.side_effects.submit(
+                "log", logging.debug, "MIDI IN: message:%s, delta:%ss", midi_msg, delta, policy=DROP_NEWEST)
 
     def previous_pattern_behaviour(self, midi_connector: MidiInOutConnector, midi_msg, delta, is_bpm_mode: bool):
-        self._change_pattern(midi_connector, self.state_store.pattern - 1)
-        self._update_bpm(self.state_store.bpm)
+        self._change_pattern(midi_connector, self.state.pattern - 1)
+        self._update_bpm(self.state.bpm)
         self._print_status(is_bpm_mode=is_bpm_mode)
 
     def next_pattern_behaviour(self, midi_connector: MidiInOutConnector, midi_msg, delta, is_bpm_mode: bool):
-        self._change_pattern(midi_connector, self.state_store.pattern + 1)
-        self._update_bpm(self.state_store.bpm)
+        self._change_pattern(midi_connector, self.state.pattern + 1)
+        self._update_bpm(self.state.bpm)
         self._print_status(is_bpm_mode=is_bpm_mode)
 
     def toggle_play_behaviour(self, midi_connector: MidiInOutConnector, midi_msg, delta, is_bpm_mode: bool):
-        playing = not self.state_store.playing
-        if playing:
-            self.drumbrute.play(midi_connector)
-        else:
-            self.drumbrute.stop(midi_connector)
-        self.state_store.set_playing(playing)
+        playing = not self.state.playing
+        self.midi_clock.set_playing(playing)
+        self.state.set_playing(playing)
         self._print_status(is_bpm_mode=is_bpm_mode)
 
     def increase_bpm_behaviour(self, midi_connector: MidiInOutConnector, midi_msg, delta, is_bpm_mode: bool):
-        self._update_bpm(self.state_store.bpm + 1)
+        self._update_bpm(self.state.bpm + 1)
         self._print_status(is_bpm_mode=is_bpm_mode)
 
     def decrease_bpm_behaviour(self, midi_connector: MidiInOutConnector, midi_msg, delta, is_bpm_mode: bool):
-        self._update_bpm(self.state_store.bpm - 1)
+        self._update_bpm(self.state.bpm - 1)
+        self._print_status(is_bpm_mode=is_bpm_mode)
+
+    def previous_song_behaviour(self, midi_connector: MidiInOutConnector, midi_msg, delta, is_bpm_mode: bool):
+        self._jump_to_song(self.song - 1)
+        self._print_status(is_bpm_mode=is_bpm_mode)
+
+    def next_song_behaviour(self, midi_connector: MidiInOutConnector, midi_msg, delta, is_bpm_mode: bool):
+        self._jump_to_song(self.song + 1)
         self._print_status(is_bpm_mode=is_bpm_mode)
 
+    def tap_tempo_behaviour(self, midi_connector: MidiInOutConnector, midi_msg, delta, is_bpm_mode: bool):
+        bpm = self.tap_tempo.tap(midi_connector.last_event_at)
+        if bpm is not None:
+            self._update_bpm(round(bpm), ramp_beats=self.tap_ramp_beats)
+            self._print_status(is_bpm_mode=is_bpm_mode)
+
     def show_enter_bpm_mode_behaviour(self, midi_connector: MidiInOutConnector, midi_msg, delta, is_bpm_mode: bool):
         self._print_status(is_bpm_mode=is_bpm_mode)
 
     def _change_pattern(self, midi_connector: MidiInOutConnector, pattern_num: int):
         pattern_num = max(0, min(pattern_num, self._max_pattern_num() - 1))
-        drumbrute_bank = pattern_num // self.drumbrute.max_patterns
-        drumbrute_pattern = pattern_num % self.drumbrute.max_patterns
-
-        self.drumbrute.change_bank(midi_connector, drumbrute_bank)
-        self.drumbrute.change_pattern(midi_connector, drumbrute_pattern)
-        self.state_store.set_pattern(pattern_num)
-
-    def _update_bpm(self, bpm: int):
-        bpm = max(0, min(bpm, self.max_bpm))
-        self.midi_clock.set_bpm(bpm)
-        self.state_store.set_bpm(bpm)
+        # The clock process sends the bank/program change on the next quantize boundary
+        self.midi_clock.set_pattern(pattern_num)
+        self.state.set_pattern(pattern_num)
+
+    def _update_bpm(self, bpm: int, ramp_beats: int = 0):
+        bpm = max(1, min(bpm, self.max_bpm))
+        self.midi_clock.ramp_to(bpm, ramp_beats)
+        self.state.set_bpm(bpm)
+
+    def _jump_to_song(self, song: int):
+        self.song = max(0, min(song, len(self.setlist) - 1))  # type: ignore
+        step = self.setlist.step(self.song)  # type: ignore
+        # The whole step in one clock update and one state update, instead of a write per parameter
+        self.midi_clock.set_step(*step)
+        self.state.set_step(step.pattern, step.bpm, step.playing)
 
     def _max_pattern_num(self):
-        return self.drumbrute.max_patterns * self.drumbrute.max_banks
+        return self.device.num_patterns
 
-    def _print_status(
-        self,
-        is_bpm_mode: bool,
-        font: str = "ansi_shadow",
-    ):
-        bpm_text = f"BPM:{self.state_store.bpm:03d}"
-        pattern_text = f"PTRN:{self.state_store.pattern + 1:02d}"
-        bank_text = f"BNK:{self.state_store.pattern // self.drumbrute.max_patterns + 1:02d}"
+    def _print_status(self, is_bpm_mode: bool):
+        self.state.set_mode(MODE_BPM if is_bpm_mode else MODE_PLAY)
+        state = self.state.snapshot()
         label = "SET BPM" if is_bpm_mode \
-            else "PLAYING" if self.state_store.playing \
+            else "PLAYING" if state.playing \
             else "STOPPED"
-        text = f"{label}\n{bpm_text}\n{pattern_text}\n{bank_text}"
-        print("\033[H\033[J\n", end="")
-        print(render(text, font), flush=True)
+        self.side_effects.submit(
+            "display",
+            self.display.show,
+            label,
+            f"BPM:{state.bpm:03d}",
+            f"PTRN:{state.pattern + 1:02d}",
+            f"BNK:{self.device.bank_of[state.pattern] + 1:02d}" if self.setlist is None else f"SONG:{self.song + 1:02d}",
+            coalesce=True,
+        )
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from typing import Callable
+
+from app.data import StateStore
+from app.hardening import WorkerHardening, harden
+from app.shared_state import SharedState
+from app.side_effects import SideEffectQueue, DROP_OLDEST, DROP_NEWEST
+from app.startup import StartupProfile
+from devices import MidiInOutConnector, MidiClock, MVavePedalListener
+from devices.metrics import Metrics
+
+
+CLOCK_THREAD_PRIORITY = 50
+# How long the loop thread may hold the GIL once the clock thread wants it back
+SWITCH_INTERVAL = 0.0005
+
+
+class LoopSideEffectQueue(SideEffectQueue):
+    # Same interface for the single-process runtime: jobs run as callbacks on the asyncio loop that
+    # submits them, after the behaviour that queued them has returned
+
+    def submit(
+        self,
+        stage: str,
+        callback: Callable,
+        *args,
+        coalesce: bool = False,
+        policy: str = DROP_OLDEST,
+    ):
+        key = stage if coalesce else (stage, next(self._sequence))
+        if key in self._jobs:
+            self.coalesced += 1
+            self._jobs[key] = (stage, callback, args, time.perf_counter())
+            return
+        if len(self._jobs) >= self.max_size:
+            self.dropped += 1
+            if policy == DROP_NEWEST:
+                return
+            self._jobs.popitem(last=False)
+        self._jobs[key] = (stage, callback, args, time.perf_counter())
+        asyncio.get_running_loop().call_soon(self._run, key)
+
+    def _run(self, key):
+        job = self._jobs.pop(key, None)
+        if job is None:
+            return
+        stage, callback, args, submitted = job
+        started = time.perf_counter()
+        try:
+            callback(*args)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception('Side effect %s failed', stage)
+        self._record(stage, submitted, started)
+
+
+class LoopInput():
+    # rtmidi input callback that hands messages from its thread over to the asyncio loop
+
+    def __init__(self, midi_connector: MidiInOutConnector, loop: asyncio.AbstractEventLoop):
+        self._midi_connector = midi_connector
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue()
+        midi_connector.set_input_callback(self._on_input_message)
+
+    def _on_input_message(self, message, data=None):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (message, time.perf_counter()))
+
+    async def next_message(self, timeout: float):
+        try:
+            message, self._midi_connector.last_input_at = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return message
+
+
+def _run_clock(
+    clock: MidiClock,
+    stop_event: threading.Event,
+    midi_connector: MidiInOutConnector,
+    hardening: WorkerHardening | None,
+):
+    # On Linux the scheduling policy and affinity are per thread, only the clock thread goes real-time
+    if hardening is not None:
+        harden("clock thread", hardening)
+    else:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(CLOCK_THREAD_PRIORITY))
+        except (AttributeError, OSError) as error:
+            logging.info("Clock thread keeps the default scheduling: %s", error)
+    try:
+        clock.run(stop_event, midi_connector)  # type: ignore
+    finally:
+        stop_event.set()
+
+
+async def _run(
+    clock: MidiClock,
+    pedal: MVavePedalListener,
+    midi_connector: MidiInOutConnector,
+    shared_state: SharedState,
+    state_store: StateStore,
+    persist_interval: float,
+    startup_profile: StartupProfile | None,
+    hardening: WorkerHardening | None,
+    metrics: Metrics | None,
+):
+    loop = asyncio.get_running_loop()
+    stop_event = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop_event.set)
+
+    # Separate rtmidi clients so the clock thread and the loop never share a handle
+    listener_connector = midi_connector.new()
+    clock_thread = threading.Thread(
+        target=_run_clock, args=(clock, stop_event, midi_connector, hardening), name="midi-clock", daemon=True)
+    if startup_profile:
+        startup_profile.mark("controller setup")
+    clock_thread.start()
+    logging.info("Starting MIDI clock thread...")
+    listener = asyncio.create_task(pedal.listen_async(
+        stop_event, listener_connector, LoopInput(listener_connector, loop).next_message))
+    logging.info("Starting MIDI listener task...")
+
+    persisted_version = shared_state.version
+    while not stop_event.is_set() and not listener.done():
+        await asyncio.wait({listener}, timeout=persist_interval)
+        if startup_profile and clock.first_tick_at.value:
+            startup_profile.mark("clock start to first tick", clock.first_tick_at.value)
+            startup_profile.report()
+            startup_profile = None
+        if clock.follower is not None:
+            clock.follower.sync(shared_state)
+        if shared_state.version != persisted_version:
+            persisted_version = shared_state.version
+            shared_state.persist(state_store)
+        if metrics is not None:
+            metrics.set('state_writes', state_store.writes)
+            metrics.publish()
+
+    stop_event.set()
+    try:
+        await listener
+    finally:
+        await loop.run_in_executor(None, clock_thread.join)
+
+
+def run_async(
+    clock: MidiClock,
+    pedal: MVavePedalListener,
+    midi_connector: MidiInOutConnector,
+    shared_state: SharedState,
+    state_store: StateStore,
+    persist_interval: float = 1.0,
+    startup_profile: StartupProfile | None = None,
+    hardening: WorkerHardening | None = None,
+    metrics: Metrics | None = None,
+):
+    sys.setswitchinterval(SWITCH_INTERVAL)
+    asyncio.run(_run(
+        clock, pedal, midi_connector, shared_state, state_store, persist_interval, startup_profile, hardening, metrics))
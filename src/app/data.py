@@ -1,58 +1,226 @@
-import dbm.gnu
+import logging
+import mmap
+import os
+import threading
+import zlib
+from struct import Struct
 from typing import Optional
 
 from devices.midi_clock import DEFAULT_BPM
 
 
-class StateStore:
-    def __init__(self, db_file_path: str):
-        self._db = dbm.gnu.open(db_file_path, "c")
+DEFAULT_FLUSH_INTERVAL = 2.0
+
+MAGIC = b'MVST'
+VERSION = 1
+# Per-pattern tempos are kept for the whole MIDI program range
+MAX_PATTERNS = 128
+NO_PORT = -1
+LEGACY_SUFFIX = '.legacy'
+
+# One slot: magic, version, table size, write sequence, input port, output port, pattern, playing, BPM table,
+# followed by the CRC32 of all of it
+_STATE = Struct(f'<4sHHQiiHB{MAX_PATTERNS}H')
+_CRC = Struct('<I')
+# Two slots, each alone in its own page: a write torn by a power cut can only damage the slot being written,
+# the other one still holds the previous state
+SLOT_SIZE = 4096
+FILE_SIZE = 2 * SLOT_SIZE
+
+_SEQ = 3
+_INPUT_PORT = 4
+_OUTPUT_PORT = 5
+_PATTERN = 6
+_PLAYING = 7
+_BPM_TABLE = 8
+
+
+def _default_values() -> list:
+    return [MAGIC, VERSION, MAX_PATTERNS, 0, NO_PORT, NO_PORT, 0, 0] + [0] * MAX_PATTERNS
+
+
+def read_slot(buffer, slot: int) -> list | None:
+    # The slot's values, or None when it was never written or its write did not complete
+    offset = slot * SLOT_SIZE
+    values = _STATE.unpack_from(buffer, offset)
+    (crc,) = _CRC.unpack_from(buffer, offset + _STATE.size)
+    if values[0] != MAGIC or crc != zlib.crc32(buffer[offset:offset + _STATE.size]):
+        return None
+    return list(values)
 
-    def close(self):
-        self._db.close()
 
-    def _get(self, key: str, default=None):
-        value = self._db.get(key.encode())
-        if value is None:
-            return default
-        return value.decode()
+def read_state_file(path: str) -> list | None:
+    # Newest valid slot, read in place through a read-only mapping
+    with open(path, 'rb') as state_file:
+        if os.fstat(state_file.fileno()).st_size < FILE_SIZE:
+            return None
+        with mmap.mmap(state_file.fileno(), FILE_SIZE, access=mmap.ACCESS_READ) as buffer:
+            slots = [values for values in (read_slot(buffer, 0), read_slot(buffer, 1)) if values is not None]
+    return max(slots, key=lambda values: values[_SEQ], default=None)
 
-    def _set(self, key: str, value):
-        self._db[key.encode()] = str(value).encode()
+
+def read_legacy_store(path: str) -> dict[str, str] | None:
+    # Stores written before the binary format: a dbm file of text values
+    import dbm  # pylint: disable=import-outside-toplevel
+
+    if not dbm.whichdb(path):
+        return None
+    try:
+        with dbm.open(path, 'r') as db:
+            return {key.decode(): db[key].decode() for key in db.keys()}
+    except (dbm.error[0], ImportError) as error:  # type: ignore
+        logging.warning("Cannot read the previous state file %s, starting from defaults: %s", path, error)
+        return {}
+
+
+class StateStore:
+    # A fixed-layout binary state file written as A/B slots: every flush writes the whole state, with the next
+    # sequence number and a CRC, into the slot not holding the latest state and syncs it; on open, the valid
+    # slot with the highest sequence wins. Nothing is ever rewritten in place, so a power cut loses at most
+    # the changes since the last flush.
+
+    def __init__(self, db_file_path: str, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.path = db_file_path
+        self.flush_interval = flush_interval
+        self.writes = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_timer: threading.Timer | None = None
+        self._owner_pid = os.getpid()
+        self._values, legacy = self._open()
+        if legacy:
+            self._migrate(legacy)
+            self._dirty = True
+            self.flush()
+            logging.info("Migrated %d values from the previous state file of %s", len(legacy), self.path)
+
+    def _open(self) -> tuple[list, dict[str, str] | None]:
+        exists = os.path.exists(self.path)
+        values = read_state_file(self.path) if exists else None
+        legacy = None if values is not None else read_legacy_store(self.path)
+        if legacy is not None:
+            # Kept next to the new file, never deleted
+            for legacy_path in (self.path, *(f"{self.path}{suffix}" for suffix in ('.db', '.dat', '.dir', '.bak'))):
+                if os.path.exists(legacy_path):
+                    os.replace(legacy_path, legacy_path + LEGACY_SUFFIX)
+        elif values is None and exists:
+            if os.path.getsize(self.path) > FILE_SIZE:
+                raise ValueError(f"{self.path} is not a state file")
+            # Created, but power was cut before it was sized or before its first write completed
+            logging.warning("No valid slot in %s, starting from defaults", self.path)
+
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < FILE_SIZE:
+            os.ftruncate(self._fd, FILE_SIZE)
+            # Size and directory entry are durable before any slot is written
+            os.fsync(self._fd)
+            dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        return values or _default_values(), legacy
+
+    def _migrate(self, legacy: dict[str, str]):
+        for key, field in (("input_port", _INPUT_PORT), ("output_port", _OUTPUT_PORT),
+                           ("last_pattern", _PATTERN), ("playing", _PLAYING)):
+            if key in legacy:
+                self._values[field] = int(legacy[key])
+        for pattern in range(MAX_PATTERNS):
+            if f"last_bpm_{pattern}" in legacy:
+                self._values[_BPM_TABLE + pattern] = int(legacy[f"last_bpm_{pattern}"])
+
+    def close(self):
+        self.flush()
+        os.close(self._fd)
+
+    def flush(self):
+        self._check_fork()
+        with self._flush_lock:
+            with self._lock:
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                self._values[_SEQ] += 1
+                payload = _STATE.pack(*self._values)
+                seq = self._values[_SEQ]
+            os.pwrite(self._fd, payload + _CRC.pack(zlib.crc32(payload)), seq % 2 * SLOT_SIZE)
+            os.fdatasync(self._fd)
+            self.writes += 1
+
+    def _check_fork(self):
+        # Timers and locks do not survive a fork, start fresh in the child process
+        if self._owner_pid != os.getpid():
+            self._owner_pid = os.getpid()
+            self._lock = threading.Lock()
+            self._flush_lock = threading.Lock()
+            self._flush_timer = None
+
+    def _schedule_flush(self):
+        if self.flush_interval <= 0:
+            self.flush()
+            return
+        with self._lock:
+            if self._flush_timer is not None:
+                return
+            self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _set(self, field: int, value: int):
+        self._check_fork()
+        if self._values[field] == value:
+            return
+        with self._lock:
+            self._values[field] = value
+            self._dirty = True
+        self._schedule_flush()
 
     def set_input_port(self, input_port: int):
-        self._set("input_port", input_port)
+        self._set(_INPUT_PORT, input_port)
 
     @property
     def input_port(self) -> Optional[int]:
-        value = self._get("input_port")
-        return None if value is None else int(value)
+        input_port = self._values[_INPUT_PORT]
+        return None if input_port == NO_PORT else input_port
 
     def set_output_port(self, output_port: int):
-        self._set("output_port", output_port)
+        self._set(_OUTPUT_PORT, output_port)
 
     @property
     def output_port(self) -> Optional[int]:
-        value = self._get("output_port")
-        return None if value is None else int(value)
+        output_port = self._values[_OUTPUT_PORT]
+        return None if output_port == NO_PORT else output_port
 
     def set_pattern(self, pattern: int):
-        self._set("last_pattern", pattern)
+        self._set(_PATTERN, pattern)
 
     @property
     def pattern(self) -> int:
-        return int(self._get("last_pattern", 0))
+        return self._values[_PATTERN]
 
     def set_bpm(self, bpm: int):
-        self._set(f"last_bpm_{self.pattern}", bpm)
+        self.set_pattern_bpm(self.pattern, bpm)
 
     @property
     def bpm(self) -> int:
-        return int(self._get(f"last_bpm_{self.pattern}", DEFAULT_BPM))
+        return self.pattern_bpm(self.pattern)
+
+    def set_pattern_bpm(self, pattern: int, bpm: int):
+        if pattern < MAX_PATTERNS:
+            self._set(_BPM_TABLE + pattern, bpm)
+
+    def pattern_bpm(self, pattern: int) -> int:
+        # 0 is a tempo never set
+        return (self._values[_BPM_TABLE + pattern] if pattern < MAX_PATTERNS else 0) or DEFAULT_BPM
 
     def set_playing(self, playing: bool):
-        self._set("playing", int(playing))
+        self._set(_PLAYING, int(playing))
 
     @property
     def playing(self) -> bool:
-        return bool(int(self._get("playing", 0)))
+        return bool(self._values[_PLAYING])
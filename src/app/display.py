@@ -0,0 +1,81 @@
+import sys
+from functools import lru_cache
+from typing import TextIO
+
+
+DEFAULT_FONT = "ansi_shadow"
+GLYPHS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789: "
+
+CLEAR_SCREEN = "\033[H\033[J"
+CLEAR_LINE = "\033[K"
+
+
+def move_to(row: int) -> str:
+    return f"\033[{row};1H"
+
+
+def render_tiles(font: str, glyphs: str = GLYPHS) -> dict[str, list[str]]:
+    import pyfiglet  # pylint: disable=import-outside-toplevel
+
+    figlet = pyfiglet.Figlet(font=font, width=1000)
+    tiles = {glyph: figlet.renderText(glyph).split("\n")[:-1] for glyph in glyphs}
+    height = max(len(rows) for rows in tiles.values())
+    for glyph, rows in tiles.items():
+        width = max((len(row) for row in rows), default=0)
+        tiles[glyph] = [row.ljust(width) for row in rows] + [" " * width] * (height - len(rows))
+    return tiles
+
+
+class StatusDisplay():
+
+    def __init__(
+        self,
+        font: str = DEFAULT_FONT,
+        output: TextIO = sys.stdout,
+        top_margin: int = 1,
+    ):
+        # Rendered on the first draw, so startup does not pay for importing and running pyfiglet
+        self.font = font
+        self._tiles: dict[str, list[str]] | None = None
+        self._height = 0
+        self._output = output
+        self._top_margin = top_margin
+        self._screen: list[str] | None = None
+
+        self._lines: tuple[str, ...] = ()
+        self.frames = 0
+
+        self.render_line = lru_cache(maxsize=512)(self._render_line)
+
+    def _render_line(self, text: str) -> tuple[str, ...]:
+        if self._tiles is None:
+            self._tiles = render_tiles(self.font)
+            self._height = len(self._tiles[" "])
+        blank = self._tiles[" "]
+        tiles = [self._tiles.get(glyph, blank) for glyph in text.upper()]
+        return tuple("".join(tile[row] for tile in tiles).rstrip() for row in range(self._height))
+
+    def show(self, *lines: str):
+        self._lines = lines
+        self.draw(lines)
+
+    def show_message(self, message: str):
+        self.draw(self._lines, message)
+
+    def draw(self, lines: tuple[str, ...], message: str = ""):
+        screen = [row for line in lines for row in self.render_line(line)]
+        screen.append(message)
+
+        if self._screen is None or len(self._screen) != len(screen):
+            output = CLEAR_SCREEN + "\n" * self._top_margin + "\n".join(screen)
+        else:
+            output = "".join(
+                move_to(self._top_margin + index + 1) + row + CLEAR_LINE
+                for index, (row, previous) in enumerate(zip(screen, self._screen))
+                if row != previous
+            )
+        self._screen = screen
+        self.frames += 1
+        if output:
+            self._output.write(output)
+            self._output.flush()
@@ -0,0 +1,69 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+from typing import NamedTuple
+
+
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+PR_SET_TIMERSLACK = 29
+
+CLOCK_PRIORITY = 70
+LISTENER_PRIORITY = 60
+
+
+class WorkerHardening(NamedTuple):
+    cpu: int | None = None
+    priority: int | None = None
+    lock_memory: bool = True
+    disable_gc: bool = False
+
+
+def plan_hardening(cpus: list[int] | None = None) -> dict[str, WorkerHardening]:
+    # The clock gets the last core to itself and the higher priority, the listener the core before it.
+    # Both run above the chrt -f 50 the service gives the whole application.
+    cpus = sorted(os.sched_getaffinity(0)) if cpus is None else cpus
+    pinned = len(cpus) >= 2
+    return {
+        'clock': WorkerHardening(
+            cpu=cpus[-1] if pinned else None, priority=CLOCK_PRIORITY, disable_gc=True),
+        'listener': WorkerHardening(
+            cpu=cpus[-2] if pinned else None, priority=LISTENER_PRIORITY),
+    }
+
+
+def _libc_call(name: str, *args) -> int:
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    if getattr(libc, name)(*args) != 0:
+        return ctypes.get_errno()
+    return 0
+
+
+def harden(name: str, hardening: WorkerHardening):
+    applied, failed = [], []
+    if hardening.cpu is not None:
+        try:
+            os.sched_setaffinity(0, {hardening.cpu})
+            applied.append(f"cpu {hardening.cpu}")
+        except OSError as error:
+            failed.append(f"affinity: {error}")
+    if hardening.priority is not None:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(hardening.priority))
+            applied.append(f"SCHED_FIFO {hardening.priority}")
+        except OSError as error:
+            failed.append(f"SCHED_FIFO: {error}")
+    if hardening.lock_memory:
+        error = _libc_call('mlockall', MCL_CURRENT | MCL_FUTURE)
+        if error:
+            failed.append(f"mlockall: {os.strerror(error)}")
+        else:
+            applied.append("memory locked")
+    # Normal tasks get 50us of timer slack on every sleep, the spin window would have to cover it
+    if not _libc_call('prctl', PR_SET_TIMERSLACK, 1, 0, 0, 0):
+        applied.append("no timer slack")
+
+    logging.info("Hardened %s: %s", name, ", ".join(applied))
+    if failed:
+        logging.warning("Could not fully harden %s: %s", name, "; ".join(failed))
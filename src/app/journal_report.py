@@ -0,0 +1,98 @@
+import glob
+import os
+import time
+
+from devices.journal import BEHAVIOUR, IN, KINDS, OUT, JournalEvent, read_header, read_journal
+from devices.mvave_pedal import GESTURES, JOURNAL_BUTTONS
+
+_REALTIME_NAMES = {0xF8: 'CLOCK', 0xFA: 'START', 0xFB: 'CONTINUE', 0xFC: 'STOP'}
+_CLOCK = 0xF8
+
+
+def journal_paths(paths: list[str]) -> list[str]:
+    # A directory stands for every journal in it
+    found = []
+    for path in paths:
+        found += sorted(glob.glob(os.path.join(path, '*.journal'))) if os.path.isdir(path) else [path]
+    return found
+
+
+def describe(event: JournalEvent) -> str:
+    if event.kind == BEHAVIOUR:
+        button, bpm_mode, gesture = event.data
+        name = JOURNAL_BUTTONS[button].name if button < len(JOURNAL_BUTTONS) else f'button {button}'
+        description = f"{name} {'bpm' if bpm_mode else 'play'}"
+        return description + (f" {GESTURES[gesture - 1]}" if gesture else '')
+    if event.data[0] in _REALTIME_NAMES:
+        return _REALTIME_NAMES[event.data[0]]
+    data = ' '.join(f'{byte:02X}' for byte in event.data[:event.length])
+    return data + (f' (+{event.length - 3} bytes)' if event.length > 3 else '')
+
+
+def _percentiles(values: list[float]) -> str:
+    if not values:
+        return 'n=0'
+    values = sorted(values)
+    return (f"n={len(values)} p50={values[len(values) // 2] * 1000:.3f}ms "
+            f"p99={values[int(len(values) * 0.99)] * 1000:.3f}ms max={values[-1] * 1000:.3f}ms")
+
+
+def statistics(journals: dict[str, list[JournalEvent]], events: list[JournalEvent]) -> list[str]:
+    lines = []
+    for source, source_events in journals.items():
+        if not source_events:
+            lines.append(f"{source}: no events")
+            continue
+        pids = list(dict.fromkeys(event.pid for event in source_events))
+        span = source_events[-1].at - source_events[0].at
+        lines.append(
+            f"{source}: {len(source_events)} events over {span:.1f}s, "
+            f"{len(pids)} process{'es' if len(pids) > 1 else ''} ({', '.join(map(str, pids))})")
+
+    dispatch, to_output, intervals, jitter = [], [], [], []
+    last_input: dict[str, float] = {}
+    last_tick: dict[int, float] = {}
+    last_interval: dict[int, float] = {}
+    last_behaviour = None
+    for event in events:
+        if event.kind == IN:
+            last_input[event.source] = event.at
+        elif event.kind == BEHAVIOUR:
+            if not event.data[2] and event.source in last_input:
+                dispatch.append(event.at - last_input.pop(event.source))
+            last_behaviour = event.at
+        elif event.kind == OUT and event.data[0] == _CLOCK:
+            if event.pid in last_tick:
+                interval = event.at - last_tick[event.pid]
+                intervals.append(interval)
+                if event.pid in last_interval:
+                    jitter.append(abs(interval - last_interval[event.pid]))
+                last_interval[event.pid] = interval
+            last_tick[event.pid] = event.at
+        elif event.kind == OUT and last_behaviour is not None:
+            to_output.append(event.at - last_behaviour)
+            last_behaviour = None
+
+    lines.append(f"input to behaviour: {_percentiles(dispatch)}")
+    lines.append(f"behaviour to MIDI out (includes quantize wait): {_percentiles(to_output)}")
+    lines.append(f"clock tick interval: {_percentiles(intervals)}")
+    lines.append(f"clock jitter (change between consecutive intervals): {_percentiles(jitter)}")
+    return lines
+
+
+def report(paths: list[str], tail: int = 50, ticks: bool = False) -> str:
+    journals, wall_offset = {}, None
+    for path in journal_paths(paths):
+        journals[os.path.splitext(os.path.basename(path))[0]] = read_journal(path)
+        wall_offset = read_header(path)[4]
+    events = sorted((event for source_events in journals.values() for event in source_events), key=lambda e: e.at)
+    if not events:
+        return 'No journal events'
+
+    started_at = events[0].at
+    shown = [event for event in events if ticks or event.kind != OUT or event.data[0] != _CLOCK]
+    lines = [f"Journal from {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started_at + wall_offset))}"]
+    lines += [
+        f"{event.at - started_at:12.6f}s {event.source:>10}[{event.pid}] {KINDS[event.kind]:<9} {describe(event)}"
+        for event in shown[-tail:]]
+    return '\n'.join(lines + [''] + statistics(journals, events))
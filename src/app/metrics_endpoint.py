@@ -0,0 +1,146 @@
+import logging
+import os
+import re
+import socket
+import threading
+
+from devices.metrics import BUCKET_BOUNDS, Metrics
+
+DEFAULT_METRICS_SOCKET = '/tmp/mvave_drumbrute.sock'
+FETCH_TIMEOUT = 2.0
+PREFIX = 'mvave'
+
+_SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+_LABEL = re.compile(r'(\w+)="([^"]*)"')
+
+
+def render(blocks: list[Metrics]) -> str:
+    # Prometheus text exposition of what every worker last published
+    lines = []
+    for block in blocks:
+        snapshot = block.read()
+        for name, value in snapshot.counters.items():
+            metric = f'{PREFIX}_{block.name}_{name}_total'
+            lines += [f'# TYPE {metric} counter', f'{metric} {value:g}']
+        # behaviour:<name> histograms share one metric, told apart by a label
+        families: dict[str, list] = {}
+        for name, histogram in snapshot.histograms.items():
+            name, _, label = name.partition(':')
+            families.setdefault(name, []).append((f'{name}="{label}"' if label else '', histogram))
+        for name, histograms in families.items():
+            metric = f'{PREFIX}_{block.name}_{name}_seconds'
+            lines.append(f'# TYPE {metric} histogram')
+            for labels, histogram in histograms:
+                cumulative = 0
+                for bound, count in zip((*BUCKET_BOUNDS, '+Inf'), histogram.buckets):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{labels + "," if labels else ""}le="{bound}"}} {cumulative}')
+                labels = f'{{{labels}}}' if labels else ''
+                lines += [f'{metric}_sum{labels} {histogram.total:.9g}', f'{metric}_count{labels} {histogram.count}']
+            # Not part of a Prometheus histogram, exposed next to it
+            lines.append(f'# TYPE {metric}_max gauge')
+            for labels, histogram in histograms:
+                labels = f'{{{labels}}}' if labels else ''
+                lines.append(f'{metric}_max{labels} {histogram.peak:.9g}')
+    return '\n'.join(lines) + '\n'
+
+
+def fetch(path: str = DEFAULT_METRICS_SOCKET, timeout: float = FETCH_TIMEOUT) -> str:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(path)
+        chunks = []
+        while chunk := client.recv(65536):
+            chunks.append(chunk)
+    return b''.join(chunks).decode()
+
+
+def summary(text: str) -> str:
+    # Counters, and count, mean, bucket-bound percentiles and max of every histogram
+    counters: dict[str, str] = {}
+    histograms: dict[str, dict] = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if match is None:
+            continue
+        metric, labels, value = match.groups()
+        labels = dict(_LABEL.findall(labels or ''))
+        if metric.endswith('_total'):
+            counters[metric[len(PREFIX) + 1:-len('_total')]] = value
+            continue
+        for suffix in ('_bucket', '_sum', '_count', '_max'):
+            if metric.endswith(suffix):
+                le = labels.pop('le', None)
+                name = metric[len(PREFIX) + 1:-len(suffix) - len('_seconds')]
+                name += ''.join(f':{label}' for label in labels.values())
+                histogram = histograms.setdefault(name, {'buckets': []})
+                if le is None:
+                    histogram[suffix[1:]] = float(value)
+                else:
+                    histogram['buckets'].append((float(le), int(value)))
+
+    lines = [f'{name:<48} {float(value):g}' for name, value in counters.items()]
+    for name, histogram in histograms.items():
+        count = int(histogram.get('count', 0))
+        if not count:
+            lines.append(f'{name:<48} n=0')
+            continue
+        percentiles = []
+        for fraction in (0.5, 0.99):
+            bound = next(le for le, cumulative in histogram['buckets'] if cumulative >= fraction * count)
+            percentiles.append('>2.5s' if bound == float('inf') else f'<={bound * 1000:g}ms')
+        lines.append(
+            f"{name:<48} n={count} mean={histogram['sum'] / count * 1000:.3f}ms p50{percentiles[0]} "
+            f"p99{percentiles[1]} max={histogram['max'] * 1000:.3f}ms")
+    return '\n'.join(lines)
+
+
+class MetricsServer():
+    # Serves the exposition to anyone connecting to a local Unix socket, from a thread of the main process
+
+    def __init__(self, path: str, blocks: list[Metrics]):
+        self.path = path
+        self.blocks = blocks
+        self._socket: socket.socket | None = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            # Left over by a run that did not exit cleanly
+            os.unlink(self.path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self.path)
+        self._socket.listen(4)
+        # Workers are forked after this, restarted ones too: a worker outliving the main process must not
+        # keep accepting connections nobody answers
+        os.register_at_fork(after_in_child=self._close_in_child)
+        threading.Thread(target=self._serve, name='metrics', daemon=True).start()
+        logging.info('Metrics on %s', self.path)
+
+    def _serve(self):
+        while True:
+            try:
+                client, _ = self._socket.accept()  # type: ignore
+            except OSError:
+                return
+            with client:
+                try:
+                    client.sendall(render(self.blocks).encode())
+                except OSError:
+                    pass
+
+    def _close_in_child(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def stop(self):
+        if self._socket is None:
+            return
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+        self._socket = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
@@ -1,70 +1,262 @@
 
 import logging
 import multiprocessing
-import time
+import os
+import signal
+from functools import partial
+from typing import Callable
 
 from app.actions import BehaviorController
 from app.data import StateStore
-from devices import MidiInOutConnector, MidiClock, Drumbrute, MVavePedalListener, PedalButton
+from app.display import StatusDisplay
+from app.hardening import WorkerHardening, harden, plan_hardening
+from app.metrics_endpoint import DEFAULT_METRICS_SOCKET, MetricsServer
+from app.setlist import load_setlist
+from app.side_effects import SideEffectQueue
+from app.shared_state import SharedState
+from app.startup import StartupProfile
+from app.supervisor import Supervisor, DEFAULT_MAX_RESTARTS
+from devices import MidiInOutConnector, MidiClock, MVavePedalListener, PedalButton, load_device_profile
+from devices.device_profile import DEFAULT_DEVICE
+from devices.journal import DEFAULT_CAPACITY, EventJournal
+from devices.metrics import Metrics
+from devices.midi_clock import DEFAULT_SPIN_WINDOW, QUANTIZE_TICK, QUANTIZE_BAR, ClockFollower, ClockOutput
+from devices.mvave_pedal import INPUT_MODE_CALLBACK, DEFAULT_BUTTON_MAP, REPEAT, load_button_map
+from devices.sessions import SessionRecorder
+from devices.stage_timings import StageTimings
 
 
-RPI1_BPLUS_COMPENSATION = 2
+RUNTIME_PROCESS = 'process'
+RUNTIME_ASYNCIO = 'asyncio'
+RUNTIMES = (RUNTIME_PROCESS, RUNTIME_ASYNCIO)
+MAX_BPM = 300
+MAIN_METRICS_COUNTERS = ('state_writes', 'worker_restarts')
+
+
+def _run_worker(
+    target,
+    stop_event,
+    *args,
+    hardening: WorkerHardening | None = None,
+    new_connector: Callable[[], MidiInOutConnector] | None = None,
+):
+    # Turn SIGTERM/SIGINT into a clean stop so workers can finish their loops before exiting
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    if hardening is not None:
+        harden(f"{multiprocessing.current_process().name} worker", hardening)
+    if new_connector is not None:
+        # Created here, in the child, so every start has rtmidi clients of its own
+        args = (*args, new_connector())
+    target(stop_event, *args)
 
 
 def run(
     midi_connector: MidiInOutConnector,
     state_store: StateStore,
+    clock_spin_window: float | None = None,
+    input_mode: str = INPUT_MODE_CALLBACK,
+    persist_interval: float = 1.0,
+    tempo_quantize: str = QUANTIZE_TICK,
+    pattern_quantize: str = QUANTIZE_BAR,
+    lead_ticks: int = 0,
+    tap_tempo: bool = False,
+    tap_ramp_beats: int = 4,
+    record_session: str | None = None,
+    pedal_map: str = DEFAULT_BUTTON_MAP,
+    startup_profile: StartupProfile | None = None,
+    max_restarts: int = DEFAULT_MAX_RESTARTS,
+    runtime: str = RUNTIME_PROCESS,
+    realtime: bool = False,
+    journal: str | None = None,
+    journal_size: int = DEFAULT_CAPACITY,
+    clock_input_port: int | None = None,
+    clock_input_query: str | None = None,
+    output_latency_us: int = 0,
+    clock_outputs: list[tuple[int, int]] | None = None,
+    fanout_tolerance_us: int = 200,
+    device: str = DEFAULT_DEVICE,
+    device_channel: int | None = None,
+    setlist: str | None = None,
+    metrics_socket: str | None = DEFAULT_METRICS_SOCKET,
 ):
-    clock = MidiClock(compensation=RPI1_BPLUS_COMPENSATION)
-    drumbrute = Drumbrute()
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unknown runtime {runtime}, expected one of {RUNTIMES}")
+    device_profile = load_device_profile(device, device_channel)
+    songs = load_setlist(setlist, device_profile, max_bpm=MAX_BPM) if setlist else None
+    single_process = runtime == RUNTIME_ASYNCIO
+    if single_process:
+        # Not imported otherwise, asyncio is a noticeable part of the startup time
+        from app.async_runtime import LoopSideEffectQueue, run_async  # pylint: disable=import-outside-toplevel
+
+    # Hardened without an explicit window, the clock calibrates it once started, under its real scheduling
+    if clock_spin_window is None and not realtime:
+        clock_spin_window = DEFAULT_SPIN_WINDOW
+
+    if journal:
+        os.makedirs(journal, exist_ok=True)
+
+    follower = None
+    if clock_input_port is not None:
+        # Follow an external clock from its own input port instead of being the master
+        follow_connector = MidiInOutConnector(clock_input_port, None, check_interval=midi_connector.check_interval)
+        follow_connector.set_queries(clock_input_query, None)
+        follower = ClockFollower(follow_connector)
+
+    # Further ports that get the clock and start/stop, each with the latency of its device in microseconds
+    extra_outputs = tuple(
+        ClockOutput(
+            MidiInOutConnector(None, port, check_interval=midi_connector.check_interval),
+            latency_us / 1_000_000)
+        for port, latency_us in clock_outputs or ())
+
+    hardening = plan_hardening() if realtime else {}
+    clock = MidiClock(
+        spin_window=clock_spin_window,
+        tempo_quantize=tempo_quantize,
+        device=device_profile,
+        pattern_quantize=pattern_quantize,
+        lead_ticks=lead_ticks,
+        spin_yield=single_process,
+        journal=EventJournal(os.path.join(journal, 'clock.journal'), journal_size) if journal else None,
+        follower=follower,
+        output_latency=output_latency_us / 1_000_000,
+        extra_outputs=extra_outputs,
+        fanout_tolerance=fanout_tolerance_us / 1_000_000,
+        max_bpm=MAX_BPM,
+        # Frozen and disabled by the clock itself, right before its tick loop; as a thread the collector is
+        # shared with the asyncio loop, so it is never disabled there
+        freeze_gc=realtime,
+        disable_gc=realtime and not single_process and hardening['clock'].disable_gc,
+    )
+    # Workers only touch the shared-memory state, the main process is the single owner of the state file
+    shared_state = SharedState.from_store(state_store, device_profile.num_patterns)
+    # Listener-side latency counters, shared by the dispatch loop and the side-effect worker
+    timings = StageTimings()
+    side_effects = LoopSideEffectQueue(timings=timings) if single_process else SideEffectQueue(timings=timings)
     actions = BehaviorController(
-        drumbrute,
-        state_store,
+        device_profile,
+        shared_state,
         clock,
-        max_bpm=300,
+        StatusDisplay(),
+        side_effects,
+        max_bpm=MAX_BPM,
+        tap_ramp_beats=tap_ramp_beats,
+        session_recorder=SessionRecorder(record_session) if record_session else None,
+        setlist=songs,
     )
 
     pedal = MVavePedalListener(
         change_mode_threshold=3,
-        change_mode_button=PedalButton.C_PRESS
+        change_mode_button=PedalButton.C_PRESS,
+        input_mode=input_mode,
+        timings=timings,
+        button_map=load_button_map(pedal_map),
+        open_output=False,
+        freeze_gc=realtime,
+        journal=EventJournal(os.path.join(journal, 'listener.journal'), journal_size) if journal else None,
     )
     pedal.on_start(actions.on_start_behaviour)
+    pedal.on_stop(actions.on_stop_behaviour)
     pedal.on_change_mode(actions.on_change_mode_behaviour)
     pedal.on_press_change_button(actions.on_press_change_mode_button_behaviour)
-    # pedal.on_event(lambda midi_connector, msg, delta: logging.debug(
-    #     "MIDI IN: message:%s, delta:%0.000f}s", msg, delta))
+    if record_session or logging.getLogger().isEnabledFor(logging.DEBUG):
+        pedal.on_event(actions.on_event_behaviour)
     pedal.add_play_behaviour(PedalButton.A_PRESS, actions.toggle_play_behaviour)
-    pedal.add_play_behaviour(PedalButton.B_PRESS, actions.previous_pattern_behaviour)
-    pedal.add_play_behaviour(PedalButton.C_RELEASE, actions.next_pattern_behaviour)
-    pedal.add_bpm_behaviour(PedalButton.A_PRESS, actions.decrease_bpm_behaviour)
+    if songs is None:
+        pedal.add_play_behaviour(PedalButton.B_PRESS, actions.previous_pattern_behaviour)
+        pedal.add_play_behaviour(PedalButton.C_RELEASE, actions.next_pattern_behaviour)
+    else:
+        pedal.add_play_behaviour(PedalButton.B_PRESS, actions.previous_song_behaviour)
+        pedal.add_play_behaviour(PedalButton.C_RELEASE, actions.next_song_behaviour)
+    pedal.add_bpm_behaviour(
+        PedalButton.A_PRESS,
+        actions.tap_tempo_behaviour if tap_tempo else actions.decrease_bpm_behaviour)
+    if not tap_tempo:
+        pedal.add_bpm_gesture(PedalButton.A_PRESS, REPEAT, actions.decrease_bpm_behaviour)
     pedal.add_bpm_behaviour(PedalButton.B_PRESS, actions.increase_bpm_behaviour)
     pedal.add_bpm_behaviour(PedalButton.C_RELEASE, actions.show_enter_bpm_mode_behaviour)
 
+    metrics_server = None
+    main_metrics = None
+    if metrics_socket:
+        # Served from the main process, workers only publish into shared memory
+        main_metrics = Metrics('main', MAIN_METRICS_COUNTERS)
+        metrics_server = MetricsServer(
+            metrics_socket,
+            [clock.enable_metrics(), pedal.enable_metrics(), side_effects.enable_metrics(), main_metrics])
+        metrics_server.start()
+
+    try:
+        if single_process:
+            run_async(
+                clock, pedal, midi_connector, shared_state, state_store, persist_interval, startup_profile,
+                hardening.get("clock"), main_metrics)
+            restarts = 0
+        else:
+            restarts = _run_processes(
+                clock, pedal, midi_connector, shared_state, state_store, persist_interval, startup_profile,
+                max_restarts, hardening, main_metrics)
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+
+    shared_state.persist(state_store)
+    state_store.close()
+    logging.info("Main process: workers joined after %d restarts, exiting.", restarts)
+
+
+def _run_processes(
+    clock: MidiClock,
+    pedal: MVavePedalListener,
+    midi_connector: MidiInOutConnector,
+    shared_state: SharedState,
+    state_store: StateStore,
+    persist_interval: float,
+    startup_profile: StartupProfile | None,
+    max_restarts: int,
+    hardening: dict[str, WorkerHardening],
+    metrics: Metrics | None = None,
+) -> int:
     stop_event = multiprocessing.Event()
-    clock_watcher = multiprocessing.Process(
-        target=clock.run,
-        args=(stop_event, midi_connector.new()))
-    midi_watcher = multiprocessing.Process(
-        target=pedal.listen,
-        args=(stop_event, midi_connector.new()))
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    # Each worker start gets a new connector with the ports and port lists the main one was set up with, and
+    # opens its own rtmidi clients: ALSA clients inherited through the fork would stay subscribed after a
+    # worker dies, and its restarted copy would subscribe a second port on the same client
+    supervisor = Supervisor(stop_event, max_restarts=max_restarts)
+    supervisor.add(
+        "clock", partial(_run_worker, hardening=hardening.get("clock"), new_connector=midi_connector.new),
+        clock.run, stop_event, ready_at=clock.first_tick_at)
+    supervisor.add(
+        "listener", partial(_run_worker, hardening=hardening.get("listener"), new_connector=midi_connector.new),
+        pedal.listen, stop_event, ready_at=pedal.ready_at)
 
     logging.info("Force multiprocessing method to fork!")
     multiprocessing.set_start_method("fork", force=True)
 
-    midi_watcher.start()
-    logging.info("Starting MIDI listener...")
-    clock_watcher.start()
-    logging.info("Starting MIDI clock...")
+    if startup_profile:
+        startup_profile.mark("controller setup")
+    supervisor.start()
 
+    persisted_version = shared_state.version
     try:
-        while midi_watcher.is_alive() and clock_watcher.is_alive():
-            time.sleep(1)
+        while supervisor.poll(persist_interval):
+            if startup_profile and clock.first_tick_at.value:
+                startup_profile.mark("clock fork to first tick", clock.first_tick_at.value)
+                startup_profile.report()
+                startup_profile = None
+            if clock.follower is not None:
+                clock.follower.sync(shared_state)
+            if shared_state.version != persisted_version:
+                persisted_version = shared_state.version
+                shared_state.persist(state_store)
+            if metrics is not None:
+                metrics.set('state_writes', state_store.writes)
+                metrics.set('worker_restarts', supervisor.restarts)
+                metrics.publish()
     except KeyboardInterrupt:
         print("Main process: caught keyboard interrupt, terminating workers")
 
     stop_event.set()
-    stop_event.set()
-
-    midi_watcher.join()  # Wait for the worker process to finish
-    clock_watcher.join()  # Wait for the worker process to finish
-    logging.info("Main process: workers joined, exiting.")
+    supervisor.join()
+    return supervisor.restarts
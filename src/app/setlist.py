@@ -0,0 +1,66 @@
+import json
+from array import array
+from typing import NamedTuple
+
+from devices.device_profile import DeviceProfile
+from devices.midi_clock import UNSET
+
+_PATTERN = 0
+_BPM = 1
+_RAMP_BEATS = 2
+_PLAYING = 3
+_STEP_FIELDS = 4
+
+
+class SetlistStep(NamedTuple):
+    pattern: int
+    bpm: int
+    ramp_beats: int
+    # UNSET keeps the transport as it is
+    playing: int
+
+
+class Setlist():
+    # The songs of a set, checked against the device when loaded and packed into one flat array of
+    # (pattern, bpm, ramp beats, playing), so jumping to a song is an index into it
+
+    def __init__(self, names: list[str], steps: list[SetlistStep]):
+        self.names = tuple(names)
+        self._steps = array('q')
+        for step in steps:
+            self._steps.extend(step)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def step(self, song: int) -> SetlistStep:
+        offset = song * _STEP_FIELDS
+        return SetlistStep(*self._steps[offset:offset + _STEP_FIELDS])
+
+    def find(self, pattern: int) -> int:
+        # First song on the pattern, -1 when the set does not use it
+        for song in range(len(self)):
+            if self._steps[song * _STEP_FIELDS + _PATTERN] == pattern:
+                return song
+        return UNSET
+
+
+def load_setlist(path: str, device: DeviceProfile, max_bpm: int = 300) -> Setlist:
+    with open(path, encoding='utf-8') as config_file:
+        config = json.load(config_file)
+    names, steps = [], []
+    for number, song in enumerate(config['songs'], start=1):
+        name = song.get('name', f"song {number}")
+        # Patterns are numbered across banks from 1, as on the display
+        pattern = int(song['pattern']) - 1
+        if not 0 <= pattern < device.num_patterns:
+            raise ValueError(f"{name} in {path}: pattern {pattern + 1} outside 1-{device.num_patterns} of {device.name}")
+        bpm = int(song['bpm'])
+        if not 1 <= bpm <= max_bpm:
+            raise ValueError(f"{name} in {path}: BPM {bpm} outside 1-{max_bpm}")
+        playing = song.get('play')
+        names.append(name)
+        steps.append(SetlistStep(pattern, bpm, int(song.get('ramp_beats', 0)), UNSET if playing is None else int(playing)))
+    if not steps:
+        raise ValueError(f"No songs in {path}")
+    return Setlist(names, steps)
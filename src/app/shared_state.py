@@ -0,0 +1,149 @@
+import logging
+import multiprocessing
+from contextlib import contextmanager
+from multiprocessing.sharedctypes import RawArray
+from typing import NamedTuple
+
+from app.data import StateStore
+from devices.midi_clock import DEFAULT_BPM, UNSET
+
+
+MODE_PLAY = 0
+MODE_BPM = 1
+
+_SEQ = 0
+_PATTERN = 1
+_PLAYING = 2
+_MODE = 3
+_BPM_TABLE = 4
+# Longer than any write takes: the lock was left held by a writer killed in the middle of an update
+WRITE_LOCK_TIMEOUT = 0.5
+
+
+class StateSnapshot(NamedTuple):
+    pattern: int
+    playing: bool
+    mode: int
+    bpm_table: tuple[int, ...]
+
+    @property
+    def bpm(self) -> int:
+        return self.bpm_table[self.pattern]
+
+
+class SharedState():
+    # Live controller state readable by every worker without I/O. Writers are serialized by a lock
+    # and bump the sequence number before and after each update (seqlock); readers never lock,
+    # they retry a bounded number of times while the sequence is odd or has moved.
+
+    def __init__(self, num_patterns: int, default_bpm: int = DEFAULT_BPM):
+        self.num_patterns = num_patterns
+        self._data = RawArray('q', _BPM_TABLE + num_patterns)
+        self._write_lock = multiprocessing.Lock()
+        for pattern in range(num_patterns):
+            self._data[_BPM_TABLE + pattern] = default_bpm
+
+    @classmethod
+    def from_store(cls, state_store: StateStore, num_patterns: int) -> 'SharedState':
+        state = cls(num_patterns)
+        with state._write() as data:
+            data[_PATTERN] = max(0, min(state_store.pattern, num_patterns - 1))
+            data[_PLAYING] = int(state_store.playing)
+            for pattern in range(num_patterns):
+                data[_BPM_TABLE + pattern] = state_store.pattern_bpm(pattern)
+        return state
+
+    def persist(self, state_store: StateStore):
+        snapshot = self.snapshot()
+        state_store.set_pattern(snapshot.pattern)
+        state_store.set_playing(snapshot.playing)
+        for pattern, bpm in enumerate(snapshot.bpm_table):
+            state_store.set_pattern_bpm(pattern, bpm)
+
+    @property
+    def version(self) -> int:
+        return self._data[_SEQ]
+
+    @contextmanager
+    def _write(self):
+        if not self._write_lock.acquire(timeout=WRITE_LOCK_TIMEOUT):
+            # Taken over from the dead writer, released at the end of this update like any other
+            logging.warning("Shared state lock not released by a dead writer, taking it over")
+        data = self._data
+        try:
+            if data[_SEQ] % 2:
+                # The dead writer's update never completed, start from an even sequence again
+                data[_SEQ] += 1
+            data[_SEQ] += 1
+            try:
+                yield data
+            finally:
+                data[_SEQ] += 1
+        finally:
+            self._write_lock.release()
+
+    def _read(self) -> list[int]:
+        data = self._data
+        for _ in range(1000):
+            seq = data[_SEQ]
+            values = data[:]
+            if seq % 2 == 0 and data[_SEQ] == seq:
+                break
+        return values
+
+    def snapshot(self) -> StateSnapshot:
+        values = self._read()
+        return StateSnapshot(
+            pattern=values[_PATTERN],
+            playing=bool(values[_PLAYING]),
+            mode=values[_MODE],
+            bpm_table=tuple(values[_BPM_TABLE:]),
+        )
+
+    def set_pattern(self, pattern: int):
+        with self._write() as data:
+            data[_PATTERN] = pattern
+
+    @property
+    def pattern(self) -> int:
+        return self._data[_PATTERN]
+
+    def set_bpm(self, bpm: int):
+        with self._write() as data:
+            data[_BPM_TABLE + data[_PATTERN]] = bpm
+
+    @property
+    def bpm(self) -> int:
+        data = self._data
+        for _ in range(1000):
+            seq = data[_SEQ]
+            bpm = data[_BPM_TABLE + data[_PATTERN]]
+            if seq % 2 == 0 and data[_SEQ] == seq:
+                break
+        return bpm
+
+    def set_playing(self, playing: bool):
+        with self._write() as data:
+            data[_PLAYING] = int(playing)
+
+    def set_step(self, pattern: int, bpm: int, playing: int = UNSET):
+        # Pattern, its tempo and optionally the transport as one update
+        with self._write() as data:
+            data[_PATTERN] = pattern
+            data[_BPM_TABLE + pattern] = bpm
+            if playing != UNSET:
+                data[_PLAYING] = playing
+
+    @property
+    def playing(self) -> bool:
+        return bool(self._data[_PLAYING])
+
+    def set_mode(self, mode: int):
+        if self._data[_MODE] == mode:
+            return
+        with self._write() as data:
+            data[_MODE] = mode
+
+    @property
+    def mode(self) -> int:
+        return self._data[_MODE]
@@ -0,0 +1,95 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from devices.metrics import Metrics
+from devices.stage_timings import StageTimings
+
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+METRICS_COUNTERS = ('dropped', 'coalesced')
+METRICS_HISTOGRAMS = ('display',)
+
+
+class SideEffectQueue():
+
+    def __init__(self, max_size: int = 32, timings: StageTimings | None = None):
+        self.max_size = max_size
+        self.timings = timings or StageTimings()
+        self.dropped = 0
+        self.coalesced = 0
+        self._jobs: OrderedDict = OrderedDict()
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._owner_pid: int | None = None
+        self.metrics: Metrics | None = None
+        self._counted = {'dropped': 0, 'coalesced': 0}
+
+    def enable_metrics(self) -> Metrics:
+        # A block of its own, written only by the thread running the jobs
+        self.metrics = Metrics('side_effects', METRICS_COUNTERS, METRICS_HISTOGRAMS)
+        return self.metrics
+
+    def _record(self, stage: str, submitted: float, started: float):
+        elapsed = time.perf_counter() - started
+        self.timings.record(f'{stage}_wait', started - submitted)
+        self.timings.record(stage, elapsed)
+        if self.metrics is not None:
+            # Jobs are rare and slow next to a publish, every one is published
+            self.metrics.observe(stage, elapsed)
+            # Added as increments, so they carry on from what a previous listener process published
+            for counter, total in (('dropped', self.dropped), ('coalesced', self.coalesced)):
+                self.metrics.count(counter, total - self._counted[counter])
+                self._counted[counter] = total
+            self.metrics.publish()
+
+    def submit(
+        self,
+        stage: str,
+        callback: Callable,
+        *args,
+        coalesce: bool = False,
+        policy: str = DROP_OLDEST,
+    ):
+        # Coalesced jobs share the stage as key, so a newer one replaces the one still waiting
+        key = stage if coalesce else (stage, next(self._sequence))
+        self._ensure_worker()
+        with self._condition:
+            if key in self._jobs:
+                self.coalesced += 1
+            elif len(self._jobs) >= self.max_size:
+                self.dropped += 1
+                if policy == DROP_NEWEST:
+                    return
+                self._jobs.popitem(last=False)
+            self._jobs[key] = (stage, callback, args, time.perf_counter())
+            self._condition.notify()
+
+    def _ensure_worker(self):
+        # Started lazily so the worker thread lives in the process that submits, not its parent
+        if self._owner_pid == os.getpid():
+            return
+        self._owner_pid = os.getpid()
+        self._condition = threading.Condition()
+        self._jobs.clear()
+        threading.Thread(target=self._work, name="side-effects", daemon=True).start()
+
+    def _work(self):
+        if self.metrics is not None:
+            self.metrics.resume()
+        while True:
+            with self._condition:
+                while not self._jobs:
+                    self._condition.wait()
+                _, (stage, callback, args, submitted) = self._jobs.popitem(last=False)
+            started = time.perf_counter()
+            try:
+                callback(*args)
+            except Exception:  # pylint: disable=broad-except
+                logging.exception('Side effect %s failed', stage)
+            self._record(stage, submitted, started)
@@ -0,0 +1,36 @@
+import logging
+import os
+import time
+
+
+def process_age() -> float | None:
+    # Seconds since the kernel started this process, so interpreter startup is part of the profile
+    try:
+        with open('/proc/self/stat', encoding='ascii') as stat_file:
+            fields = stat_file.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime', encoding='ascii') as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupProfile():
+
+    def __init__(self, started_at: float | None = None):
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        age = process_age()
+        self.interpreter = None if age is None else max(0.0, age - (time.perf_counter() - self.started_at))
+        self.phases: list[tuple[str, float]] = []
+        self._last = self.started_at
+
+    def mark(self, phase: str, at: float | None = None):
+        at = time.perf_counter() if at is None else at
+        self.phases.append((phase, at - self._last))
+        self._last = at
+
+    def report(self):
+        lines = [] if self.interpreter is None else [f"  {'python startup':<26} {self.interpreter * 1000:8.1f}ms"]
+        lines += [f"  {phase:<26} {seconds * 1000:8.1f}ms" for phase, seconds in self.phases]
+        total = self._last - self.started_at + (self.interpreter or 0.0)
+        logging.info("Startup profile:\n%s\n  %-26s %8.1fms", "\n".join(lines), "time to first clock tick", total * 1000)
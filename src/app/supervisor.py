@@ -0,0 +1,101 @@
+import logging
+import multiprocessing
+import time
+from multiprocessing.connection import wait
+from typing import Callable
+
+
+DEFAULT_MAX_RESTARTS = 5
+DEFAULT_RESTART_WINDOW = 60.0
+
+
+class Worker():
+
+    def __init__(self, name: str, target: Callable, args: tuple, ready_at=None):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.ready_at = ready_at
+        self.process: multiprocessing.Process | None = None
+        self.restarts: list[float] = []
+        self.died_at: float | None = None
+
+    def start(self):
+        if self.ready_at is not None:
+            self.ready_at.value = 0.0
+        self.process = multiprocessing.Process(target=self.target, args=self.args, name=self.name)
+        self.process.start()
+
+
+class Supervisor():
+    # Waits on the worker process sentinels, so a dead worker is noticed as soon as it exits, and
+    # restarts only that worker. Live state is in shared memory, the new process picks it up from there.
+
+    def __init__(
+        self,
+        stop_event,
+        max_restarts: int = DEFAULT_MAX_RESTARTS,
+        restart_window: float = DEFAULT_RESTART_WINDOW,
+    ):
+        self.stop_event = stop_event
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.workers: list[Worker] = []
+        self.restarts = 0
+        self.recovery_times: list[float] = []
+
+    def add(self, name: str, target: Callable, *args, ready_at=None):
+        self.workers.append(Worker(name, target, args, ready_at))
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+            logging.info("Started %s worker (pid %d)", worker.name, worker.process.pid)  # type: ignore
+
+    def poll(self, timeout: float) -> bool:
+        sentinels = {worker.process.sentinel: worker for worker in self.workers}  # type: ignore
+        for sentinel in wait(list(sentinels), timeout):
+            worker = sentinels[sentinel]  # type: ignore
+            worker.process.join()  # type: ignore
+            if self.stop_event.is_set():
+                return False
+            if not self._restart(worker):
+                return False
+        self._check_recovered()
+        return not self.stop_event.is_set()
+
+    def _restart(self, worker: Worker) -> bool:
+        now = time.perf_counter()
+        worker.restarts = [at for at in worker.restarts if now - at < self.restart_window] + [now]
+        if len(worker.restarts) > self.max_restarts:
+            logging.error(
+                "%s worker died %d times in %.0fs, giving up",
+                worker.name, len(worker.restarts), self.restart_window)
+            return False
+
+        self.restarts += 1
+        logging.warning(
+            "%s worker died (exit code %s), restarting (restart %d)",
+            worker.name, worker.process.exitcode, self.restarts)  # type: ignore
+        worker.died_at = now
+        worker.start()
+        if worker.ready_at is None:
+            self._recovered(worker, time.perf_counter())
+        return True
+
+    def _check_recovered(self):
+        for worker in self.workers:
+            if worker.died_at is not None and worker.ready_at is not None and worker.ready_at.value:
+                self._recovered(worker, worker.ready_at.value)
+
+    def _recovered(self, worker: Worker, ready_at: float):
+        recovery = ready_at - worker.died_at  # type: ignore
+        worker.died_at = None
+        self.recovery_times.append(recovery)
+        logging.info(
+            "%s worker recovered in %.1fms (%d restarts, worst recovery %.1fms)",
+            worker.name, recovery * 1000, self.restarts, max(self.recovery_times) * 1000)
+
+    def join(self):
+        for worker in self.workers:
+            worker.process.join()  # type: ignore
@@ -0,0 +1,37 @@
+import statistics
+
+
+class TapTempo():
+
+    def __init__(
+        self,
+        max_taps: int = 8,
+        min_intervals: int = 2,
+        reset_after: float = 2.0,
+        tolerance: float = 0.25,
+    ):
+        self.max_taps = max_taps
+        self.min_intervals = min_intervals
+        self.reset_after = reset_after
+        self.tolerance = tolerance
+        self._taps: list[float] = []
+
+    def reset(self):
+        self._taps.clear()
+
+    def tap(self, timestamp: float) -> float | None:
+        if self._taps and timestamp - self._taps[-1] > self.reset_after:
+            self._taps.clear()
+        self._taps.append(timestamp)
+        del self._taps[:-self.max_taps]
+        return self.bpm
+
+    @property
+    def bpm(self) -> float | None:
+        intervals = [later - earlier for earlier, later in zip(self._taps, self._taps[1:])]
+        if len(intervals) < self.min_intervals:
+            return None
+        # Drop taps that are off the median by more than the tolerance (missed or doubled presses)
+        median = statistics.median(intervals)
+        steady = [interval for interval in intervals if abs(interval - median) <= median * self.tolerance]
+        return 60.0 / statistics.fmean(steady) if steady and median > 0 else None
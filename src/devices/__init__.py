@@ -1,4 +1,5 @@
 from devices.drumbrute import Drumbrute
+from devices.device_profile import DeviceProfile, load_device_profile
 from devices.midi_clock import MidiClock
 from devices.midi_connector import MidiInOutConnector
 from devices.mvave_pedal import MVavePedalListener, PedalButton
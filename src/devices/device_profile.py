@@ -0,0 +1,102 @@
+import glob
+import json
+import os
+
+from devices.midi_connector import MidiInOutConnector
+from devices.midi_output import CONTINUE, START, STOP
+
+
+DEVICE_PROFILES_DIR = os.path.join(os.path.dirname(__file__), 'machines')
+DEFAULT_DEVICE = 'drumbrute'
+
+# Status of each channel message type a select message can use, the channel is added at load time
+MESSAGE_TYPES = {'note': 0x90, 'cc': 0xB0, 'pc': 0xC0}
+TRANSPORT_MESSAGES = {'start': START, 'continue': CONTINUE, 'stop': STOP}
+# Data bytes of a select message template are numbers or one of 'bank', 'program' (inside the bank) and 'index'
+Template = list[list[int | str]]
+
+
+def available_devices() -> list[str]:
+    return sorted(os.path.splitext(os.path.basename(path))[0] for path in glob.glob(os.path.join(DEVICE_PROFILES_DIR, '*.json')))
+
+
+def read_device_config(device: str = DEFAULT_DEVICE) -> dict:
+    # A profile name from the machines directory or the path of a profile file
+    path = device if os.path.isfile(device) else os.path.join(DEVICE_PROFILES_DIR, f'{device}.json')
+    if not os.path.isfile(path):
+        raise ValueError(f"Unknown device {device}, expected a profile file or one of {available_devices()}")
+    with open(path, encoding='utf-8') as config_file:
+        return json.load(config_file)
+
+
+def load_device_profile(device: str = DEFAULT_DEVICE, channel: int | None = None) -> 'DeviceProfile':
+    config = read_device_config(device)
+    if channel is not None:
+        config['channel'] = channel
+    return DeviceProfile(**config)
+
+
+class DeviceProfile():
+    # Pattern layout, channel, transport and select message formats of a drum machine. Every select
+    # message is rendered once here, so switching pattern is a table lookup.
+
+    def __init__(
+        self,
+        name: str,
+        channel: int,
+        patterns_per_bank: int,
+        banks: int,
+        bank_select: Template,
+        pattern_select: Template,
+        transport: dict[str, str] | None = None,
+    ):
+        transport = transport or {}
+        self.name = name
+        self.channel = channel
+        self.max_patterns = patterns_per_bank
+        self.max_banks = banks
+        self.num_patterns = patterns_per_bank * banks
+        self._start = TRANSPORT_MESSAGES[transport.get('start', 'start')]
+        self._stop = TRANSPORT_MESSAGES[transport.get('stop', 'stop')]
+        # Only for devices that pick up from where they stopped, a followed continue is a start otherwise
+        self._continue = TRANSPORT_MESSAGES[transport['continue']] if 'continue' in transport else None
+
+        self.bank_of = tuple(index // patterns_per_bank for index in range(self.num_patterns))
+        # Per pattern index: the messages to select it from another bank, and from its own bank
+        self._select = tuple(
+            self._render(bank_select, index) + self._render(pattern_select, index) for index in range(self.num_patterns))
+        self._select_in_bank = tuple(self._render(pattern_select, index) for index in range(self.num_patterns))
+
+    def _render(self, template: Template, index: int) -> tuple[bytes, ...]:
+        bank, program = divmod(index, self.max_patterns)
+        values = {'bank': bank, 'program': program, 'index': index}
+        messages = []
+        for message_type, *data in template:
+            if message_type not in MESSAGE_TYPES:
+                raise ValueError(f"Unknown message type {message_type} in {self.name}, expected one of {list(MESSAGE_TYPES)}")
+            data = [values[value] if isinstance(value, str) else value for value in data]
+            if any(not 0 <= value <= 127 for value in data):
+                raise ValueError(f"{self.name} pattern {index}: {message_type} data {data} out of the MIDI range")
+            messages.append(bytes([MESSAGE_TYPES[message_type] + (self.channel - 1), *data]))
+        return tuple(messages)
+
+    def select_messages(self, pattern_num: int, current_bank: int | None = None) -> tuple[bytes, ...]:
+        pattern_num = max(0, min(pattern_num, self.num_patterns - 1))
+        return (self._select_in_bank if self.bank_of[pattern_num] == current_bank else self._select)[pattern_num]
+
+    def select(self, midi_connector: MidiInOutConnector, pattern_num: int, current_bank: int | None = None):
+        for message in self.select_messages(pattern_num, current_bank):
+            midi_connector.send_message(message)
+
+    def stop(self, midi_connector: MidiInOutConnector):
+        midi_connector.send_realtime(self._stop)
+
+    def play(self, midi_connector: MidiInOutConnector):
+        midi_connector.send_realtime(self._start)
+
+    @property
+    def can_continue(self) -> bool:
+        return self._continue is not None
+
+    def resume(self, midi_connector: MidiInOutConnector):
+        midi_connector.send_realtime(self._continue)  # type: ignore
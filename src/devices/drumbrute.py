@@ -1,7 +1,8 @@
+from devices.device_profile import DeviceProfile, read_device_config
 from devices.midi_connector import MidiInOutConnector
 
 
-class Drumbrute():
+class Drumbrute(DeviceProfile):
 
     NOTE = 0x90
     CC = 0xB0
@@ -13,24 +14,16 @@ class Drumbrute():
         self,
         channel: int = 10,
     ):
-        self.channel = channel
-        self.max_patterns = 16
-        self.max_banks = 4
+        config = read_device_config('drumbrute')
+        config['channel'] = channel
+        super().__init__(**config)
 
     def change_pattern(self, midi_connector: MidiInOutConnector, pattern_num: int) -> int:
-        cmd = self.PC + (self.channel - 1)
         pattern_num = max(0, min(pattern_num, self.max_patterns - 1))
-        midi_connector.send_message([cmd, 0, pattern_num])
+        midi_connector.send_message(self._select_in_bank[pattern_num][0])
         return pattern_num
 
     def change_bank(self, midi_connector: MidiInOutConnector, bank_num: int) -> int:
-        cmd = self.CC + (self.channel - 1)
         bank_num = max(0, min(bank_num, self.max_banks - 1))
-        midi_connector.send_message([cmd, 0, bank_num])
+        midi_connector.send_message(self._select[bank_num * self.max_patterns][0])
         return bank_num
-
-    def stop(self, midi_connector: MidiInOutConnector):
-        midi_connector.send_message([self.STOP, 255, 255])
-
-    def play(self, midi_connector: MidiInOutConnector):
-        midi_connector.send_message([self.START, 255, 255])
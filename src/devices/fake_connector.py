@@ -0,0 +1,110 @@
+import threading
+import time
+
+from devices.midi_connector import MidiInOutConnector
+from devices.sessions import Session
+
+
+class FakeMidiIn():
+
+    def __init__(self, ports: list[str]):
+        self.ports = ports
+        self.polls = 0
+        self._open = False
+        self._pending = []
+        self._callback = None
+
+    def get_ports(self) -> list[str]:
+        return self.ports
+
+    def is_port_open(self) -> bool:
+        return self._open
+
+    def open_port(self, port: int = 0):
+        self._open = True
+
+    def close_port(self):
+        self._open = False
+
+    def ignore_types(self, **kwargs):
+        pass
+
+    def set_callback(self, callback, data=None):
+        self._callback = callback
+
+    def cancel_callback(self):
+        self._callback = None
+
+    def get_message(self):
+        self.polls += 1
+        return self._pending.pop(0) if self._pending else None
+
+    def receive(self, message: list[int], delta: float):
+        if self._callback:
+            self._callback((message, delta))
+        else:
+            self._pending.append((message, delta))
+
+
+class FakeMidiOut():
+
+    def __init__(self, ports: list[str]):
+        self.ports = ports
+        self.sent: list[tuple[float, tuple[int, ...]]] = []
+        self._open = False
+
+    def get_ports(self) -> list[str]:
+        return self.ports
+
+    def is_port_open(self) -> bool:
+        return self._open
+
+    def open_port(self, port: int = 0):
+        self._open = True
+
+    def close_port(self):
+        self._open = False
+
+    def set_error_callback(self, callback, data=None):
+        pass
+
+    def send_message(self, message):
+        self.sent.append((time.perf_counter(), tuple(message)))
+
+
+class FakeMidiConnector(MidiInOutConnector):
+    # In-process stand-in for the rtmidi handles: records what is sent and replays scripted input,
+    # so the listener, the behaviours and the clock can run on a machine without MIDI hardware.
+
+    def __init__(
+        self,
+        input_ports: tuple[str, ...] = ('Fake pedal',),
+        output_ports: tuple[str, ...] = ('Fake drum machine',),
+    ):
+        super().__init__(0, 0)
+        self._midi_in = FakeMidiIn(list(input_ports))
+        self._midi_out = FakeMidiOut(list(output_ports))
+        self.received: list[tuple[float, tuple[int, ...]]] = []
+
+    @property
+    def sent(self) -> list[tuple[float, tuple[int, ...]]]:
+        return self._midi_out.sent
+
+    def press(self, message: list[int]):
+        now = time.perf_counter()
+        delta = now - self.received[-1][0] if self.received else 0.0
+        self.received.append((now, tuple(message)))
+        self._midi_in.receive(list(message), delta)
+
+    def replay(self, session: Session, speed: float = 1.0, stop_event: threading.Event | None = None):
+        started_at = time.perf_counter()
+        for offset, message in session:
+            delay = started_at + offset / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if stop_event is not None and stop_event.is_set():
+                return
+            self.press(message)
+
+    def new(self):
+        return self
@@ -0,0 +1,125 @@
+from bisect import bisect_left
+from multiprocessing.sharedctypes import RawArray
+from typing import NamedTuple
+
+# Seconds between two publishes of a worker's metrics
+PUBLISH_INTERVAL = 1.0
+# Upper bounds in seconds of the histogram buckets, the last bucket takes everything above
+BUCKET_BOUNDS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Raw samples kept between two publishes, bucketed early only if the buffer fills up
+SAMPLE_CAPACITY = 4096
+# Per histogram: one count per bucket, then count, sum and max
+_HISTOGRAM_FIELDS = len(BUCKET_BOUNDS) + 4
+
+
+class HistogramSnapshot(NamedTuple):
+    buckets: tuple[int, ...]
+    count: int
+    total: float
+    peak: float
+
+
+class MetricsSnapshot(NamedTuple):
+    counters: dict[str, float]
+    histograms: dict[str, HistogramSnapshot]
+
+
+class Histogram():
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.peak = 0.0
+
+    def observe(self, value: float):
+        self.buckets[bisect_left(BUCKET_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.peak:
+            self.peak = value
+
+
+class Metrics():
+    # Counters and histograms of one worker. The hot loops only touch plain objects of their own process:
+    # a counter addition, or a sample stored in a preallocated buffer. publish() buckets the samples and
+    # copies everything into a shared block (seqlock, single writer) from time to time, so other processes
+    # read them without ever making the worker wait or take a lock.
+
+    def __init__(self, name: str, counters: tuple[str, ...], histograms: tuple[str, ...] = ()):
+        self.name = name
+        self.counter_names = counters
+        self.histogram_names = histograms
+        self.counters = dict.fromkeys(counters, 0.0)
+        self.histograms = {histogram: Histogram() for histogram in histograms}
+        self._histogram_ids = {histogram: index for index, histogram in enumerate(histograms)}
+        self._histogram_list = list(self.histograms.values())
+        self._sample_ids = [0] * SAMPLE_CAPACITY
+        self._samples = [0.0] * SAMPLE_CAPACITY
+        self._pending = 0
+        self._shared = RawArray('d', 1 + len(counters) + len(histograms) * _HISTOGRAM_FIELDS)
+
+    def count(self, counter: str, amount: float = 1):
+        self.counters[counter] += amount
+
+    def set(self, counter: str, value: float):
+        self.counters[counter] = value
+
+    def observe(self, histogram: str, value: float):
+        # Names not declared are not collected
+        index = self._histogram_ids.get(histogram)
+        if index is not None:
+            pending = self._pending
+            if pending == SAMPLE_CAPACITY:
+                self.fold()
+                pending = 0
+            self._sample_ids[pending] = index
+            self._samples[pending] = value
+            self._pending = pending + 1
+
+    def fold(self):
+        # Buckets the samples stored since the last call
+        pending = self._pending
+        self._pending = 0
+        histograms = self._histogram_list
+        for index, value in zip(self._sample_ids[:pending], self._samples[:pending]):
+            histograms[index].observe(value)
+
+    def publish(self):
+        self.fold()
+        values = list(self.counters.values())
+        for histogram in self.histograms.values():
+            values += histogram.buckets
+            values += (histogram.count, histogram.total, histogram.peak)
+        data = self._shared
+        data[0] += 1
+        data[1:] = values
+        data[0] += 1
+
+    def resume(self):
+        # A restarted worker continues from what its predecessor published, so counters never go back
+        snapshot = self.read()
+        self._pending = 0
+        self.counters.update(snapshot.counters)
+        for name, published in snapshot.histograms.items():
+            histogram = self.histograms[name]
+            histogram.buckets = list(published.buckets)
+            histogram.count, histogram.total, histogram.peak = published.count, published.total, published.peak
+
+    def read(self) -> MetricsSnapshot:
+        data = self._shared
+        for _ in range(1000):
+            seq = data[0]
+            values = data[1:]
+            if seq % 2 == 0 and data[0] == seq:
+                break
+        counters = dict(zip(self.counter_names, values))
+        histograms = {}
+        offset = len(self.counter_names)
+        for name in self.histogram_names:
+            fields = values[offset:offset + _HISTOGRAM_FIELDS]
+            count, total, peak = fields[-3:]
+            histograms[name] = HistogramSnapshot(tuple(int(bucket) for bucket in fields[:-3]), int(count), total, peak)
+            offset += _HISTOGRAM_FIELDS
+        return MetricsSnapshot(counters, histograms)
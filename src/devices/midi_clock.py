@@ -1,41 +1,609 @@
+import gc
+import logging
+import queue
 import time
-from multiprocessing import Value
+from multiprocessing.sharedctypes import RawArray, RawValue
 from multiprocessing.synchronize import Event
+from typing import NamedTuple
 
+from devices.device_profile import DeviceProfile
+from devices.journal import EventJournal
 from devices.midi_connector import MidiInOutConnector
+from devices.metrics import PUBLISH_INTERVAL, Metrics
+from devices.midi_output import CLOCK
+from devices.tempo_tracker import TICKS_PER_BEAT, TempoTracker
 
 DEFAULT_BPM = 120
 CLOCK_TICK_CMD = 0xF8
+START_CMD = 0xFA
+CONTINUE_CMD = 0xFB
+STOP_CMD = 0xFC
+DEFAULT_SPIN_WINDOW = 0.0005
+MIN_SPIN_WINDOW = 0.0001
+MAX_SPIN_WINDOW = 0.002
+DEFAULT_REPORT_INTERVAL = 60.0
+# Outputs whose latency compensation differs by less than this get the tick in the same burst (one byte
+# takes 320us on a DIN link anyway)
+FANOUT_TOLERANCE = 0.0002
+# Output latencies are checked against the tick interval at this tempo
+MAX_BPM = 300
+METRICS_COUNTERS = ('slips', 'pattern_changes', 'messages_out', 'bytes_out', 'reconnects')
+# press_to_send: from the control write of a pattern or transport change to its messages being sent,
+# quantization included
+METRICS_HISTOGRAMS = ('tick_jitter', 'tick_lateness', 'press_to_send')
+
+QUANTIZE_TICK = 'tick'
+QUANTIZE_BEAT = 'beat'
+QUANTIZE_BAR = 'bar'
+QUANTIZE_MODES = (QUANTIZE_TICK, QUANTIZE_BEAT, QUANTIZE_BAR)
+
+_SEQ = 0
+_TEMPO_VERSION = 1
+_BPM = 2
+_RAMP_BEATS = 3
+_PATTERN = 4
+_PLAYING = 5
+_WRITTEN_AT = 6
+_CONTROL_FIELDS = 7
+
+UNSET = -1
+
+
+class ClockSettings(NamedTuple):
+    seq: int
+    tempo_version: int
+    bpm: int
+    ramp_beats: int
+    pattern: int
+    playing: int
+    # perf_counter_ns of the last write
+    written_at: int
+
+
+class ClockControl():
+    # Single-writer channel from the listener to the clock in raw shared memory. The writer bumps the
+    # sequence number before and after each update (seqlock), so neither side ever takes a lock and the
+    # clock only has to compare one integer per tick to know whether anything changed.
+
+    def __init__(self, bpm: int = DEFAULT_BPM):
+        self._data = RawArray('q', _CONTROL_FIELDS)
+        self._data[_BPM] = bpm
+        self._data[_PATTERN] = UNSET
+        self._data[_PLAYING] = UNSET
+
+    @property
+    def version(self) -> int:
+        return self._data[_SEQ]
+
+    def _write(self, *values: tuple[int, int]):
+        data = self._data
+        if data[_SEQ] % 2:
+            # Only a writer killed in the middle of an update leaves it odd: the restarted one starts even again
+            data[_SEQ] += 1
+        data[_SEQ] += 1
+        for index, value in values:
+            data[index] = value
+        data[_WRITTEN_AT] = time.perf_counter_ns()
+        data[_SEQ] += 1
+
+    def set_bpm(self, bpm: int, ramp_beats: int = 0):
+        self._write((_TEMPO_VERSION, self._data[_TEMPO_VERSION] + 1), (_BPM, bpm), (_RAMP_BEATS, ramp_beats))
+
+    def set_pattern(self, pattern: int):
+        self._write((_PATTERN, pattern))
+
+    def set_playing(self, playing: bool):
+        self._write((_PLAYING, int(playing)))
+
+    def set_step(self, pattern: int, bpm: int, ramp_beats: int = 0, playing: int = UNSET):
+        # Everything a setlist step changes in a single write, so the clock picks it up on one tick
+        values = [(_TEMPO_VERSION, self._data[_TEMPO_VERSION] + 1), (_BPM, bpm), (_RAMP_BEATS, ramp_beats),
+                  (_PATTERN, pattern)]
+        if playing != UNSET:
+            values.append((_PLAYING, playing))
+        self._write(*values)
+
+    def read(self) -> ClockSettings:
+        # Bounded, an update left half done by a dead writer must not hang the clock
+        data = self._data
+        for _ in range(1000):
+            seq = data[_SEQ]
+            values = data[:]
+            if seq % 2 == 0 and data[_SEQ] == seq:
+                break
+        return ClockSettings(*values)
+
+
+class ClockState(NamedTuple):
+    last_tick_at: float
+    bpm: float
+    position: int
+    tempo_version: int
+    pattern: int
+    bank: int
+    playing: bool
+
+
+class ClockStatus():
+    # What the clock has actually sent, published by the clock after every tick (seqlock, single
+    # writer) so a restarted clock process can continue on the same tick grid and transport state.
+
+    def __init__(self):
+        self._data = RawArray('d', 1 + len(ClockState._fields))
+
+    def publish(self, *values):
+        data = self._data
+        data[0] += 1
+        data[1:] = values
+        data[0] += 1
+
+    def read(self) -> ClockState | None:
+        data = self._data
+        for _ in range(1000):
+            seq = data[0]
+            values = data[1:]
+            if seq % 2 == 0 and data[0] == seq:
+                break
+        # After the writer died mid-update the last copy is the best there is
+        if not values[0]:
+            return None
+        last_tick_at, bpm, position, tempo_version, pattern, bank, playing = values
+        return ClockState(last_tick_at, bpm, int(position), int(tempo_version), int(pattern), int(bank), bool(playing))
+
+
+class ClockStats():
+
+    def __init__(self):
+        self.drift = 0.0
+        self.slips = 0
+        self.reset()
+
+    def reset(self):
+        self.ticks = 0
+        self.max_jitter = 0.0
+        self.total_jitter = 0.0
+
+    @property
+    def mean_jitter(self) -> float:
+        return self.total_jitter / self.ticks if self.ticks else 0.0
+
+    def record(self, lateness: float, interval_error: float):
+        jitter = abs(interval_error)
+        self.ticks += 1
+        self.total_jitter += jitter
+        self.max_jitter = max(self.max_jitter, jitter)
+        self.drift = lateness
+
+
+class ClockOutput(NamedTuple):
+    midi_connector: MidiInOutConnector
+    # Seconds from sending a tick to the device acting on it (USB-MIDI interface, device input buffering)
+    latency: float = 0.0
+
+
+class ClockFollower():
+    # External clock input, read by the clock process: 0xF8/0xFA/0xFB/0xFC from its own input port are
+    # timestamped in the rtmidi callback and fed to the tempo tracker between ticks. The settled BPM and
+    # transport changes are published in shared memory for the main process to put in the shared state.
+
+    def __init__(self, midi_connector: MidiInOutConnector, tracker: TempoTracker | None = None):
+        self.midi_connector = midi_connector
+        self.tracker = tracker or TempoTracker()
+        self.settled_bpm = RawValue('q', 0)
+        # Transport change count, then the play flag it changed to
+        self._transport = RawArray('q', 2)
+        self._messages: queue.SimpleQueue = queue.SimpleQueue()
+        self._synced_bpm = 0
+        self._synced_transport = 0
+
+    def open(self):
+        self.midi_connector.set_input_callback(self._on_message)
+        self.midi_connector.open_ports(with_output=False)
+        # rtmidi drops timing messages unless asked not to
+        self.midi_connector.midi_in.ignore_types(sysex=True, timing=False, active_sense=True)
+
+    def _on_message(self, message, data=None):
+        self._messages.put((message[0][0], time.perf_counter()))
+
+    def poll(self, now: float) -> int:
+        # Feeds the ticks received since the last call to the tracker, returns the last transport status
+        transport = 0
+        while True:
+            try:
+                status, at = self._messages.get_nowait()
+            except queue.Empty:
+                break
+            if status == CLOCK_TICK_CMD:
+                self.tracker.tick(at)
+            elif status in (START_CMD, CONTINUE_CMD, STOP_CMD):
+                transport = status
+                self._transport[1] = int(status != STOP_CMD)
+                self._transport[0] += 1
+
+        tracker = self.tracker
+        if tracker.is_lost(now):
+            logging.warning('External MIDI clock lost, free running at %.2f BPM', tracker.bpm)
+            tracker.reset()
+        elif tracker.settled_bpm is not None and tracker.settled_bpm != self.settled_bpm.value:
+            logging.info('External MIDI clock settled at %d BPM', tracker.settled_bpm)
+            self.settled_bpm.value = tracker.settled_bpm
+        return transport
+
+    def sync(self, state):
+        # Main process side: the settled tempo and external start/stop go to the shared state
+        settled = self.settled_bpm.value
+        if settled and settled != self._synced_bpm:
+            self._synced_bpm = settled
+            state.set_bpm(settled)
+        transport = self._transport[0]
+        if transport != self._synced_transport:
+            self._synced_transport = transport
+            state.set_playing(bool(self._transport[1]))
 
 
 class MidiClock():
 
-    def __init__(self, compensation: int = 0):
-        self._bpm = Value('i', DEFAULT_BPM)
-        self._compensation = compensation
+    def __init__(
+        self,
+        spin_window: float | None = DEFAULT_SPIN_WINDOW,
+        report_interval: float = DEFAULT_REPORT_INTERVAL,
+        tempo_quantize: str = QUANTIZE_TICK,
+        device: DeviceProfile | None = None,
+        pattern_quantize: str = QUANTIZE_BAR,
+        beats_per_bar: int = 4,
+        lead_ticks: int = 0,
+        spin_yield: bool = False,
+        journal: EventJournal | None = None,
+        follower: ClockFollower | None = None,
+        output_latency: float = 0.0,
+        extra_outputs: tuple[ClockOutput, ...] = (),
+        fanout_tolerance: float = FANOUT_TOLERANCE,
+        max_bpm: int = MAX_BPM,
+        freeze_gc: bool = False,
+        disable_gc: bool = False,
+    ):
+        for name, quantize in (('tempo', tempo_quantize), ('pattern', pattern_quantize)):
+            if quantize not in QUANTIZE_MODES:
+                raise ValueError(f"Unknown {name} quantize {quantize}, expected one of {QUANTIZE_MODES}")
+        latencies = [output_latency, *(output.latency for output in extra_outputs)]
+        if max(latencies) - min(latencies) >= self.tick_interval(max_bpm):
+            # The last delayed send would land after the next tick's deadline, every tick would slip
+            raise ValueError(
+                f"Output latencies spread over {(max(latencies) - min(latencies)) * 1e6:.0f}us, "
+                f"more than a tick at {max_bpm} BPM ({self.tick_interval(max_bpm) * 1e6:.0f}us)")
+        self.control = ClockControl()
+        self.status = ClockStatus()
+        self.spin_window = spin_window
+        self.report_interval = report_interval
+        self.tempo_quantize = tempo_quantize
+        self.device = device
+        self.pattern_quantize = pattern_quantize
+        self.beats_per_bar = beats_per_bar
+        self.lead_ticks = lead_ticks
+        self.spin_yield = spin_yield
+        self.journal = journal
+        self.follower = follower
+        self.output_latency = output_latency
+        self.extra_outputs = extra_outputs
+        self.fanout_tolerance = fanout_tolerance
+        self.freeze_gc = freeze_gc
+        self.disable_gc = disable_gc
+        self.metrics: Metrics | None = None
+        self.stats = ClockStats()
+        # perf_counter of the first tick sent, readable from the process that started the clock
+        self.first_tick_at = RawValue('d', 0.0)
 
     @property
     def bpm(self):
-        return self._bpm.value
+        return self.control.read().bpm
 
     def set_bpm(self, bpm):
-        with self._bpm.get_lock():
-            self._bpm.value = bpm
+        self.control.set_bpm(bpm)
+
+    def ramp_to(self, bpm: int, beats: int):
+        self.control.set_bpm(bpm, ramp_beats=beats)
+
+    def set_pattern(self, pattern_num: int):
+        self.control.set_pattern(pattern_num)
+
+    def set_playing(self, playing: bool):
+        self.control.set_playing(playing)
+
+    def set_step(self, pattern: int, bpm: int, ramp_beats: int = 0, playing: int = UNSET):
+        self.control.set_step(pattern, bpm, ramp_beats, playing)
+
+    @staticmethod
+    def tick_interval(bpm: float) -> float:
+        return 60.0 / (max(1, bpm) * TICKS_PER_BEAT)
+
+    @staticmethod
+    def calibrate_spin_window(samples: int = 50, duration: float = 0.0001) -> float:
+        # Size the spin window from how late sleeps actually wake up here, with this process's scheduling
+        overshoots = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            time.sleep(duration)
+            overshoots.append(time.perf_counter() - started - duration)
+        overshoots.sort()
+        worst = overshoots[int(len(overshoots) * 0.98)]
+        return min(MAX_SPIN_WINDOW, max(MIN_SPIN_WINDOW, worst * 1.5))
+
+    def boundary_ticks(self, quantize: str) -> int:
+        return {
+            QUANTIZE_TICK: 1,
+            QUANTIZE_BEAT: TICKS_PER_BEAT,
+            QUANTIZE_BAR: TICKS_PER_BEAT * self.beats_per_bar,
+        }[quantize]
 
     def run(
         self,
         stop_event: Event,
         midi_connector: MidiInOutConnector
     ):
-        midi_connector.open_ports()
+        midi_connector.open_ports(with_input=False)
+        for output in self.extra_outputs:
+            output.midi_connector.open_ports(with_input=False)
+        # Fan-out order: the slowest output first on the tick deadline, each other one delayed by how much
+        # faster it is, so all devices act on the tick at the same time
+        outputs = [ClockOutput(midi_connector, self.output_latency), *self.extra_outputs]
+        slowest = max(output.latency for output in outputs)
+        send_groups: list[tuple[float, list[MidiInOutConnector]]] = []
+        for output in sorted(outputs, key=lambda output: -output.latency):
+            delay = slowest - output.latency
+            if send_groups and delay - send_groups[-1][0] < self.fanout_tolerance:
+                send_groups[-1][1].append(output.midi_connector)
+            else:
+                send_groups.append((delay, [output.midi_connector]))
+        lead_outputs = send_groups[0][1]
+        delayed_groups = send_groups[1:]
+        connectors = [output.midi_connector for output in outputs]
+        if self.journal is not None:
+            self.journal.open()
+            for connector in connectors:
+                connector.set_journal(self.journal)
+        if self.spin_window is None:
+            self.spin_window = self.calibrate_spin_window()
+            logging.info('MIDI clock spin window calibrated to %.3fms', self.spin_window * 1000)
+
+        control = self.control
+        device = self.device
+        follower = self.follower
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.resume()
+        # Totals of this process's connectors already added to the metrics
+        metrics_seen = dict.fromkeys(('messages_out', 'bytes_out', 'reconnects'), 0)
+        transport_written = 0
+        if follower is not None:
+            follower.open()
+        tempo_boundary = self.boundary_ticks(self.tempo_quantize)
+        pattern_boundary = self.boundary_ticks(self.pattern_quantize)
+        lead_ticks = self.lead_ticks
+
+        settings = control.read()
+        seen_version = UNSET
+        tempo_version = settings.tempo_version
+        target_bpm = settings.bpm
+        bpm: float = target_bpm
+        tempo_pending = False
+        ramp_from, ramp_ticks, ramp_step = bpm, 0, 0
+        applied_pattern = UNSET
+        applied_bank = None
+        playing = False
+        start_pending = False
+        # The pending start is a continue: the song position is kept
+        continuing = False
+
+        interval = self.tick_interval(bpm)
+        anchor = time.perf_counter()
+        tick = 0
+        position = 0
+        last_sent = None
+
+        resume = self.status.read()
+        if resume is not None:
+            # Restarted after a crash: stay on the previous tick grid and keep the song position and
+            # transport, ticks that fell due while no clock was running are skipped, not burst
+            tempo_version = resume.tempo_version
+            bpm = resume.bpm
+            interval = self.tick_interval(bpm)
+            tick = int((anchor - resume.last_tick_at) // interval) + 1
+            anchor = resume.last_tick_at
+            self.stats.slips += tick - 1
+            if metrics is not None:
+                metrics.count('slips', tick - 1)
+            position = resume.position
+            applied_pattern = resume.pattern
+            applied_bank = None if resume.bank == UNSET else resume.bank
+            playing = resume.playing
+            logging.info('MIDI clock resumed at song position %d, %d ticks skipped', position, tick - 1)
+        # The control's transport is edge-triggered: a start or stop from a followed clock holds until
+        # the pedal asks for a different transport, whatever else is written to the control meanwhile.
+        # On a cold start nothing is known about the device, the first transport read is always sent.
+        control_playing = UNSET if resume is None else int(playing)
+        next_report = anchor + self.report_interval
+        next_publish = anchor
+
+        if self.freeze_gc:
+            # Everything allocated so far, the warmup above included, is never scanned again
+            gc.collect()
+            gc.freeze()
+        gc_enabled = gc.isenabled()
+        if self.disable_gc:
+            # Only around the tick loop, it is enabled again once the loop exits
+            gc.disable()
 
         while not stop_event.is_set():
-            bpm = self.bpm + self._compensation
-            pulse_rate = 60.0 / (bpm * 24)
-            midi_connector.send_message([CLOCK_TICK_CMD, 255, 255])
-            t1 = time.perf_counter()
-            if bpm <= 3000:
-                time.sleep(pulse_rate * 0.8)
-            t2 = time.perf_counter()
-            while not stop_event.is_set() and (t2 - t1) < pulse_rate:
-                t2 = time.perf_counter()
+            deadline = anchor + tick * interval
+            self._wait_until(deadline)
+            for connector in lead_outputs:
+                if start_pending:
+                    # Start right before a tick, so that tick is the first one of the song position
+                    (device.resume if continuing else device.play)(connector)  # type: ignore
+                connector.send_realtime(CLOCK)
+            sent = time.perf_counter()
+            for delay, group in delayed_groups:
+                # Relative to the lead send, so a late tick keeps the outputs in phase with each other. Only the
+                # lead send is spun for: hardened (no timer slack), a plain sleep lands these about as close as
+                # a byte takes on the wire
+                remaining = sent + delay - time.perf_counter()
+                if remaining > 0:
+                    time.sleep(remaining)
+                for connector in group:
+                    if start_pending:
+                        (device.resume if continuing else device.play)(connector)  # type: ignore
+                    connector.send_realtime(CLOCK)
+            if start_pending:
+                start_pending = False
+                if not continuing:
+                    position = 0
+                if metrics is not None and transport_written:
+                    metrics.observe('press_to_send', sent - transport_written / 1e9)
+            if last_sent is None:
+                self.first_tick_at.value = sent
+
+            interval_error = 0.0 if last_sent is None else sent - last_sent - interval
+            self.stats.record(sent - deadline, interval_error)
+            if metrics is not None:
+                metrics.observe('tick_lateness', sent - deadline)
+                metrics.observe('tick_jitter', abs(interval_error))
+            last_sent = sent
+            tick += 1
+            on_tempo_boundary = position % tempo_boundary == 0
+            position += 1
+            if position % TICKS_PER_BEAT == 0:
+                for connector in connectors:
+                    connector.check_connection()
+                if follower is not None:
+                    follower.midi_connector.check_connection()
+                if metrics is not None and sent >= next_publish:
+                    self._publish_metrics(connectors, metrics_seen)
+                    next_publish = sent + PUBLISH_INTERVAL
+
+            if sent - deadline > interval:
+                # A stall longer than a whole tick: restart the grid instead of bursting missed ticks
+                self.stats.slips += 1
+                if metrics is not None:
+                    metrics.count('slips')
+                anchor, tick = sent, 1
+
+            if control.version != seen_version:
+                settings = control.read()
+                seen_version = settings.seq
+                if settings.tempo_version != tempo_version:
+                    tempo_version = settings.tempo_version
+                    # Following an external clock, the tempo only comes from there
+                    tempo_pending = follower is None
+                if device is not None and settings.playing != UNSET and settings.playing != control_playing:
+                    control_playing = settings.playing
+                    playing = bool(settings.playing)
+                    start_pending = playing
+                    continuing = False
+                    transport_written = settings.written_at
+                    if not playing:
+                        for connector in connectors:
+                            device.stop(connector)
+                        if metrics is not None:
+                            metrics.observe('press_to_send', time.perf_counter() - transport_written / 1e9)
+
+            if follower is not None:
+                transport = follower.poll(sent)
+                if device is not None and transport:
+                    playing = transport != STOP_CMD
+                    start_pending = playing
+                    # A continue carries on from the position the source stopped at, as a continue when the
+                    # device has one; a device that cannot continue is started from the top
+                    continuing = transport == CONTINUE_CMD and device.can_continue
+                    transport_written = 0
+                    if not playing:
+                        for connector in connectors:
+                            device.stop(connector)
+                if follower.tracker.locked:
+                    # Tick on the tracker's predicted grid: the source's tempo and phase without its jitter
+                    tracker = follower.tracker
+                    bpm = target_bpm = tracker.bpm
+                    interval = tracker.period  # type: ignore
+                    anchor, tick = tracker.next_tick_after(sent + interval / 2) - interval, 1
+
+            if device is not None and settings.pattern != UNSET and settings.pattern != applied_pattern and (
+                    not playing or start_pending or (position + lead_ticks) % pattern_boundary == 0):
+                # Queued behind the tick just sent, so a pattern switch never delays the clock
+                for message in device.select_messages(settings.pattern, applied_bank):
+                    midi_connector.queue_message(message)
+                midi_connector.flush_messages()
+                applied_pattern = settings.pattern
+                applied_bank = device.bank_of[settings.pattern]
+                if metrics is not None:
+                    metrics.count('pattern_changes')
+                    if settings.written_at:
+                        metrics.observe('press_to_send', time.perf_counter() - settings.written_at / 1e9)
+
+            if tempo_pending and on_tempo_boundary:
+                tempo_pending = False
+                target_bpm = settings.bpm
+                ramp_from, ramp_ticks, ramp_step = bpm, settings.ramp_beats * TICKS_PER_BEAT, 0
+            if ramp_ticks:
+                # Ramps are interpolated here, per tick, so a single control write drives the whole sweep
+                ramp_step += 1
+                next_bpm = ramp_from + (target_bpm - ramp_from) * ramp_step / ramp_ticks
+                if ramp_step >= ramp_ticks:
+                    ramp_ticks = 0
+            else:
+                next_bpm = target_bpm
+            if next_bpm != bpm:
+                # Rebase on the last tick so the new tempo starts from where the old one left off
+                anchor, tick = anchor + (tick - 1) * interval, 1
+                bpm = next_bpm
+                interval = self.tick_interval(bpm)
+
+            self.status.publish(
+                anchor + (tick - 1) * interval, bpm, position, tempo_version, applied_pattern,
+                UNSET if applied_bank is None else applied_bank, playing)
+
+            if sent >= next_report:
+                self._report()
+                next_report = sent + self.report_interval
+
+        if self.disable_gc and gc_enabled:
+            gc.enable()
+        self._report()
+        if metrics is not None:
+            self._publish_metrics(connectors, metrics_seen)
+        if self.journal is not None:
+            self.journal.close()
+
+    def _wait_until(self, deadline: float):
+        remaining = deadline - time.perf_counter() - self.spin_window  # type: ignore
+        if remaining > 0:
+            time.sleep(remaining)
+        # As a thread next to other Python code, give the GIL away while spinning
+        while time.perf_counter() < deadline:
+            if self.spin_yield:
+                time.sleep(0)
+
+    def enable_metrics(self) -> Metrics:
+        self.metrics = Metrics('clock', METRICS_COUNTERS, METRICS_HISTOGRAMS)
+        return self.metrics
+
+    def _publish_metrics(self, connectors: list[MidiInOutConnector], seen: dict[str, int]):
+        # Added as increments, a restarted clock's connectors count from zero again
+        totals = {
+            'messages_out': sum(connector.writer.messages_sent for connector in connectors),
+            'bytes_out': sum(connector.writer.bytes_sent for connector in connectors),
+            'reconnects': sum(connector.reconnects for connector in connectors),
+        }
+        for counter, total in totals.items():
+            self.metrics.count(counter, total - seen[counter])  # type: ignore
+            seen[counter] = total
+        self.metrics.publish()  # type: ignore
+
+    def _report(self):
+        logging.info(
+            'MIDI clock: %d ticks, jitter mean %.3fms max %.3fms, drift %.3fms, slips %d',
+            self.stats.ticks,
+            self.stats.mean_jitter * 1000,
+            self.stats.max_jitter * 1000,
+            self.stats.drift * 1000,
+            self.stats.slips,
+        )
+        self.stats.reset()
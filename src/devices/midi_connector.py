@@ -1,15 +1,46 @@
+import logging
+import queue
+import time
 
 import rtmidi
 
+from devices.journal import EventJournal
+from devices.midi_output import MidiWriter
+
+DEFAULT_CHECK_INTERVAL = 2.0
+
 
 class MidiInOutConnector:
     # pylint: disable=no-member
 
-    def __init__(self, input_port: int | None = None, output_port: int | None = None):
+    def __init__(
+        self,
+        input_port: int | None = None,
+        output_port: int | None = None,
+        check_interval: float = DEFAULT_CHECK_INTERVAL,
+        running_status: bool = False,
+    ):
         self._input_port = input_port
         self._output_port = output_port
         self._midi_in = None
         self._midi_out = None
+        self._writer: MidiWriter | None = None
+        self.running_status = running_status
+        self._input_queue: queue.SimpleQueue | None = None
+        self._input_callback = None
+
+        self.check_interval = check_interval
+        self.reconnects = 0
+        self._input_query: str | None = None
+        self._output_query: str | None = None
+        self._input_ports: list[str] | None = None
+        self._output_ports: list[str] | None = None
+        self._input_name: str | None = None
+        self._output_name: str | None = None
+        self._connected = True
+        self._next_check = 0.0
+        self.last_input_at = 0.0
+        self.last_event_at = 0.0
 
     @property
     def midi_in(self) -> rtmidi.MidiIn:  # pyright: ignore[reportAttributeAccessIssue]
@@ -21,40 +52,163 @@ class MidiInOutConnector:
     def midi_out(self) -> rtmidi.MidiOut:  # pyright: ignore[reportAttributeAccessIssue]
         if not self._midi_out:
             self._midi_out = rtmidi.MidiOut()  # pyright: ignore[reportAttributeAccessIssue]
+            self._midi_out.set_error_callback(self._on_midi_error)
         return self._midi_out
 
+    @property
+    def writer(self) -> MidiWriter:
+        if not self._writer:
+            self._writer = MidiWriter(self.midi_out, running_status=self.running_status)
+        return self._writer
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
     def query_input_port(self, query: str | None = None) -> int | None:
         return self._query_port(self.get_input_ports(), query)
 
     def query_output_port(self, query: str | None = None) -> int | None:
         return self._query_port(self.get_output_ports(), query)
 
-    def open_ports(self):
-        if self._input_port is None or self._output_port is None:
+    def set_queries(self, input_query: str | None, output_query: str | None):
+        self._input_query = input_query
+        self._output_query = output_query
+
+    def open_ports(self, with_input: bool = True, with_output: bool = True):
+        if (with_input and self._input_port is None) or (with_output and self._output_port is None):
             raise ValueError("Input and output ports must be set before opening ports")
 
+        if with_input:
+            self._open_input(self._input_port)  # type: ignore
+        if with_output:
+            self._open_output(self._output_port)  # type: ignore
+        self._connected = True
+        self._next_check = time.monotonic() + self.check_interval
+
+    def _open_input(self, port: int):
         if self.midi_in.is_port_open():
             self.midi_in.close_port()
-        self.midi_in.open_port(self._input_port)
+        self.midi_in.open_port(port)
+        if self._input_callback is not None:
+            self.midi_in.set_callback(self._input_callback)
+        self._input_port = port
+        self._input_name = self.get_input_ports()[port]
+
+    def _open_output(self, port: int):
         if self.midi_out.is_port_open():
             self.midi_out.close_port()
-        self.midi_out.open_port(self._output_port)
-
-    def check_connection(self):
-        self.get_input_ports()
-        self.get_output_ports()
+        self.midi_out.open_port(port)
+        self.writer.reset()
+        self._output_port = port
+        self._output_name = self.get_output_ports()[port]
+
+    def check_connection(self) -> bool:
+        now = time.monotonic()
+        if now < self._next_check:
+            return self._connected
+        self._next_check = now + self.check_interval
+
+        self.refresh_ports()
+        input_lost = self._input_name is not None and self._input_name not in self._input_ports  # type: ignore
+        output_lost = self._output_name is not None and self._output_name not in self._output_ports  # type: ignore
+        if not input_lost and not output_lost:
+            self._connected = True
+            return True
+
+        if self._connected:
+            logging.warning(
+                "MIDI device unplugged: %s",
+                ", ".join(name for name, lost in (
+                    (self._input_name, input_lost), (self._output_name, output_lost)) if lost))
+        self._connected = self._reconnect(input_lost, output_lost)
+        return self._connected
+
+    def _reconnect(self, input_lost: bool, output_lost: bool) -> bool:
+        input_port = self._find_port(self._input_ports, self._input_query, self._input_name) \
+            if input_lost else self._input_port
+        output_port = self._find_port(self._output_ports, self._output_query, self._output_name) \
+            if output_lost else self._output_port
+        # Connectors for one direction only (clock fan-out and follower ports) have no port for the other
+        if (input_lost and input_port is None) or (output_lost and output_port is None):
+            return False
+
+        if input_lost:
+            self._open_input(input_port)
+        if output_lost:
+            self._open_output(output_port)
+        self.reconnects += 1
+        logging.info("MIDI reconnected: INPUT %s OUTPUT %s", self._input_name, self._output_name)
+        return True
+
+    def _find_port(self, available_ports, query: str | None, name: str | None) -> int | None:
+        if query is not None:
+            return self._query_port(available_ports, query)
+        return available_ports.index(name) if name in available_ports else None
+
+    def _on_midi_error(self, error_type, error_message, data=None):
+        if self._next_check:
+            logging.warning("MIDI error: %s", error_message)
+        self._next_check = 0.0
+
+    def refresh_ports(self):
+        # Only the directions this connector opened, so it never creates a client it does not use
+        if self._input_name is not None or self._output_name is None:
+            self._input_ports = self.midi_in.get_ports()
+        if self._output_name is not None or self._input_name is None:
+            self._output_ports = self.midi_out.get_ports()
 
     def get_input_ports(self) -> list[str]:
-        return self.midi_in.get_ports()
+        if self._input_ports is None:
+            self._input_ports = self.midi_in.get_ports()
+        return self._input_ports
 
     def get_output_ports(self) -> list[str]:
-        return self.midi_out.get_ports()
+        if self._output_ports is None:
+            self._output_ports = self.midi_out.get_ports()
+        return self._output_ports
 
     def get_input_message(self):
-        return self.midi_in.get_message()
+        message = self.midi_in.get_message()
+        if message:
+            self.last_input_at = time.perf_counter()
+        return message
+
+    def set_input_callback(self, callback):
+        self._input_callback = callback
+        self.midi_in.set_callback(callback)
+
+    def enable_input_queue(self):
+        if self._input_queue is None:
+            self._input_queue = queue.SimpleQueue()
+            self.set_input_callback(self._on_input_message)
+
+    def wait_input_message(self, timeout: float | None = None):
+        if self._input_queue is None:
+            return self.get_input_message()
+        try:
+            message, self.last_input_at = self._input_queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return message
+
+    def _on_input_message(self, message, data=None):
+        self._input_queue.put((message, time.perf_counter()))  # type: ignore
+
+    def set_journal(self, journal: EventJournal | None):
+        self.writer.journal = journal
+
+    def send_message(self, message: list[int] | bytes):
+        self.writer.send(message)
+
+    def send_realtime(self, message: bytes):
+        self.writer.send_realtime(message)
+
+    def queue_message(self, message: list[int] | bytes):
+        self.writer.enqueue(message)
 
-    def send_message(self, message: list[int]):
-        self.midi_out.send_message(message)
+    def flush_messages(self):
+        self.writer.flush()
 
     def set_ports(self, input_port: int, output_port: int):
         self._input_port = input_port
@@ -69,4 +223,10 @@ class MidiInOutConnector:
             if query in port_name.lower()), None)
 
     def new(self):
-        return MidiInOutConnector(self._input_port, self._output_port)
+        connector = MidiInOutConnector(
+            self._input_port, self._output_port, self.check_interval, self.running_status)
+        connector.set_queries(self._input_query, self._output_query)
+        # Same port lists, so the new connector only creates the rtmidi clients for the ports it opens
+        connector._input_ports = self._input_ports
+        connector._output_ports = self._output_ports
+        return connector
@@ -0,0 +1,80 @@
+from collections import deque
+from typing import Sequence
+
+from devices.journal import EventJournal, OUT
+
+CLOCK = bytes([0xF8])
+START = bytes([0xFA])
+CONTINUE = bytes([0xFB])
+STOP = bytes([0xFC])
+
+# Data bytes that follow each status, by high nibble for channel messages and by status for system ones
+_CHANNEL_DATA_LENGTHS = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2}
+_SYSTEM_DATA_LENGTHS = {0xF1: 1, 0xF2: 2, 0xF3: 1}
+
+
+def message_length(status: int) -> int:
+    if status < 0xF0:
+        return 1 + _CHANNEL_DATA_LENGTHS[status & 0xF0]
+    return 1 + _SYSTEM_DATA_LENGTHS.get(status, 0)
+
+
+def encode(message: Sequence[int]) -> bytes:
+    if isinstance(message, bytes):
+        return message
+    status = message[0]
+    if status < 0x80:
+        raise ValueError(f"MIDI message must start with a status byte: {list(message)}")
+    if status == 0xF0:
+        return bytes(message)
+    length = message_length(status)
+    if len(message) < length:
+        raise ValueError(f"MIDI message too short, expected {length} bytes: {list(message)}")
+    return bytes(message[:length])
+
+
+class MidiWriter():
+
+    def __init__(self, midi_out, running_status: bool = False):
+        self._midi_out = midi_out
+        self._queue: deque[bytes] = deque()
+        self.running_status = running_status
+        self._last_status = None
+        self.bytes_sent = 0
+        self.messages_sent = 0
+        self.journal: EventJournal | None = None
+
+    def send_realtime(self, message: bytes):
+        # System real-time bytes never interrupt running status, so they can jump ahead of anything queued
+        self._midi_out.send_message(message)
+        self.bytes_sent += len(message)
+        self.messages_sent += 1
+        if self.journal is not None:
+            self.journal.record(OUT, message)
+
+    def send(self, message: Sequence[int]):
+        message = encode(message)
+        status = message[0]
+        if status >= 0xF8:
+            self.send_realtime(message)
+            return
+        if self.journal is not None:
+            self.journal.record(OUT, message)
+        if self.running_status and status < 0xF0 and status == self._last_status:
+            message = message[1:]
+        else:
+            self._last_status = status if status < 0xF0 else None
+        self._midi_out.send_message(message)
+        self.bytes_sent += len(message)
+        self.messages_sent += 1
+
+    def enqueue(self, message: Sequence[int]):
+        self._queue.append(encode(message))
+
+    def flush(self):
+        while self._queue:
+            self.send(self._queue.popleft())
+
+    def reset(self):
+        self._last_status = None
+        self._queue.clear()
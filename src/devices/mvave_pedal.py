@@ -1,20 +1,157 @@
+import gc
+import json
+import os
 import time
 import logging
+from multiprocessing.sharedctypes import RawValue
 from typing import Callable
 
+from devices.journal import EventJournal, IN, BEHAVIOUR
 from devices.midi_connector import MidiInOutConnector
+from devices.metrics import PUBLISH_INTERVAL, Metrics
+from devices.stage_timings import StageTimings
 from enum import Enum
 
 
+INPUT_MODE_CALLBACK = 'callback'
+INPUT_MODE_POLL = 'poll'
+INPUT_MODES = (INPUT_MODE_CALLBACK, INPUT_MODE_POLL)
+
+
+DEFAULT_BUTTON_MAP = os.path.join(os.path.dirname(__file__), 'pedals', 'mvave.json')
+
+LONG_PRESS = 'long_press'
+DOUBLE_TAP = 'double_tap'
+REPEAT = 'repeat'
+GESTURES = (LONG_PRESS, DOUBLE_TAP, REPEAT)
+
+# messages_in is the count of the input histogram, every message received records its input latency
+METRICS_COUNTERS = ('messages_in', 'duplicates', 'reconnects')
+# Stages recorded through StageTimings: input latency and dispatch delay; plus one histogram per behaviour
+METRICS_HISTOGRAMS = ('input', 'dispatch')
+
+
 class PedalButton(Enum):
-    A_PRESS = (201, 0)
-    A_RELEASE = (185, 0)
-    B_PRESS = (193, 1)
-    C_PRESS = (153, 49)
-    C_RELEASE = (153, 42)
+    A_PRESS = 'A_PRESS'
+    A_RELEASE = 'A_RELEASE'
+    B_PRESS = 'B_PRESS'
+    C_PRESS = 'C_PRESS'
+    C_RELEASE = 'C_RELEASE'
+
+    @property
+    def release(self) -> 'PedalButton | None':
+        if not self.name.endswith('_PRESS'):
+            return None
+        return PedalButton.__members__.get(self.name[:-len('_PRESS')] + '_RELEASE')
+
 
+# Journal records name the button by its position here and the gesture by its position in GESTURES + 1
+JOURNAL_BUTTONS = list(PedalButton)
+_JOURNAL_BUTTON_IDS = {pedal_btn: index for index, pedal_btn in enumerate(JOURNAL_BUTTONS)}
 
 Behavior = Callable[[MidiInOutConnector, list[int], float, bool], None]
+ButtonMap = dict[PedalButton, tuple[int, int]]
+
+
+def load_button_map(path: str = DEFAULT_BUTTON_MAP) -> ButtonMap:
+    with open(path, encoding='utf-8') as config_file:
+        config = json.load(config_file)
+    button_map = {}
+    for name, (status, data) in config['buttons'].items():
+        if name not in PedalButton.__members__:
+            raise ValueError(f"Unknown pedal button {name} in {path}, expected one of {list(PedalButton.__members__)}")
+        button_map[PedalButton[name]] = (int(status), int(data))
+    return button_map
+
+
+def button_key(status: int, data: int) -> int:
+    return status << 8 | data & 0xFF
+
+
+class GestureEngine():
+    # Message times are rtmidi's per-message deltas summed up, so the spacing between presses is the
+    # driver's and not when Python got around to stamping them. The sum lives on the perf_counter timeline
+    # due()/next_deadline() are asked with: it is re-anchored on the receive stamp whenever it would run
+    # ahead of it (stamps are only ever late) or fall behind it by more than max_lag (clock drift).
+
+    def __init__(
+        self,
+        button_map: ButtonMap,
+        long_press: float = 0.8,
+        double_tap: float = 0.3,
+        repeat_delay: float = 0.5,
+        repeat_interval: float = 0.1,
+        debounce: float = 0.01,
+        max_hold: float = 10.0,
+        max_lag: float = 0.05,
+    ):
+        self.long_press = long_press
+        self.double_tap = double_tap
+        self.repeat_delay = repeat_delay
+        self.repeat_interval = repeat_interval
+        self.debounce = debounce
+        # Held longer than this, the release was lost: stop repeating
+        self.max_hold = max_hold
+        self.max_lag = max_lag
+        self._releases = {
+            pedal_btn.release: pedal_btn for pedal_btn in button_map if pedal_btn.release in button_map}
+        self._clock = float('-inf')
+        self._last_message = None
+        self._last_message_at = float('-inf')
+        self._last_press: dict[PedalButton, float] = {}
+        # press button -> [pressed at, next repeat at, long press fired]
+        self._held: dict[PedalButton, list] = {}
+
+    def timestamp(self, delta: float, received: float) -> float:
+        timestamp = self._clock + delta
+        if not received - self.max_lag <= timestamp <= received:
+            timestamp = received
+        self._clock = timestamp
+        return timestamp
+
+    def is_duplicate(self, midi_msg: list[int], timestamp: float) -> bool:
+        duplicate = midi_msg == self._last_message and timestamp - self._last_message_at < self.debounce
+        self._last_message, self._last_message_at = midi_msg, timestamp
+        return duplicate
+
+    def press(self, pedal_btn: PedalButton, timestamp: float) -> list[tuple[PedalButton, str, float]]:
+        if pedal_btn in self._releases:
+            self._held.pop(self._releases[pedal_btn], None)
+            return []
+
+        gestures = []
+        last_press = self._last_press.pop(pedal_btn, None)
+        if last_press is not None and timestamp - last_press <= self.double_tap:
+            # A third tap starts a new pair instead of firing again
+            gestures.append((pedal_btn, DOUBLE_TAP, timestamp - last_press))
+        else:
+            self._last_press[pedal_btn] = timestamp
+        # One foot on the pedal: a new press ends any hold whose release never arrived
+        self._held.clear()
+        if pedal_btn.release in self._releases:
+            self._held[pedal_btn] = [timestamp, timestamp + self.repeat_delay, False]
+        return gestures
+
+    def due(self, now: float) -> list[tuple[PedalButton, str, float]]:
+        gestures = []
+        for pedal_btn, hold in list(self._held.items()):
+            pressed_at, next_repeat, long_pressed = hold
+            if now - pressed_at >= self.max_hold:
+                logging.warning('No release of %s after %.1fs, hold dropped', pedal_btn.name, now - pressed_at)
+                del self._held[pedal_btn]
+                continue
+            if not long_pressed and now - pressed_at >= self.long_press:
+                hold[2] = True
+                gestures.append((pedal_btn, LONG_PRESS, now - pressed_at))
+            if now >= next_repeat:
+                hold[1] = max(next_repeat + self.repeat_interval, now)
+                gestures.append((pedal_btn, REPEAT, now - pressed_at))
+        return gestures
+
+    def next_deadline(self) -> float | None:
+        return min((
+            hold[1] if hold[2] else min(hold[1], hold[0] + self.long_press)
+            for hold in self._held.values()), default=None)
 
 
 class MVavePedalListener():
@@ -24,29 +161,71 @@ class MVavePedalListener():
         self,
         change_mode_threshold: int = 5,
         change_mode_button: PedalButton = PedalButton.C_PRESS,
+        input_mode: str = INPUT_MODE_CALLBACK,
+        poll_interval: float = 0.001,
+        wake_interval: float = 0.5,
+        timings: StageTimings | None = None,
+        report_interval: float = 60.0,
+        button_map: ButtonMap | None = None,
+        gestures: GestureEngine | None = None,
+        open_output: bool = True,
+        journal: EventJournal | None = None,
+        freeze_gc: bool = False,
     ):
+        if input_mode not in INPUT_MODES:
+            raise ValueError(f"Unknown input mode {input_mode}, expected one of {INPUT_MODES}")
         self.change_mode_threshold = change_mode_threshold
         self.change_mode_button = change_mode_button
+        self.input_mode = input_mode
+        self.poll_interval = poll_interval
+        self.wake_interval = wake_interval
+        self.timings = timings or StageTimings()
+        self.report_interval = report_interval
+        self.open_output = open_output
+        self.journal = journal
+        self.freeze_gc = freeze_gc
+        # perf_counter when the listener started taking input, readable from the process that started it
+        self.ready_at = RawValue('d', 0.0)
+        self.button_map = button_map if button_map is not None else load_button_map()
+        # The change mode button keeps its own threshold and its release may be skipped, leave it out
+        self.gestures = gestures or GestureEngine({
+            pedal_btn: value for pedal_btn, value in self.button_map.items()
+            if pedal_btn not in (change_mode_button, change_mode_button.release)})
         self._play_behaviours = {}
         self._bpm_behaviours = {}
+        self._play_gestures: dict[tuple[PedalButton, str], Behavior] = {}
+        self._bpm_gestures: dict[tuple[PedalButton, str], Behavior] = {}
+        self._play_table: dict[int, Behavior] | None = None
+        self._bpm_table: dict[int, Behavior] = {}
+        self._buttons: dict[int, PedalButton] = {}
 
         self._on_event: Behavior = lambda *args: None
         self._on_start: Behavior = lambda *args: None
+        self._on_stop: Behavior = lambda *args: None
         self._on_mode_change: Behavior = lambda *args: None
         self._on_press_change_button: Callable[[], None] = lambda: None
-        self._change_mode_start = None
+        self._change_mode_start: float | None = None
         self._skip_next_message = False
+        self._event_time = time.perf_counter()
+        self._timed_gestures = False
+        self._next_report = 0.0
+        self.metrics: Metrics | None = None
+        self._behaviour_metrics: dict[tuple[PedalButton, bool], str] = {}
+        self._next_publish = 0.0
+        self._reconnects_seen = 0
+
+    def bpm_mode_at(self, timestamp: float) -> bool:
+        if self._change_mode_start is None:
+            return False
+        return timestamp - self._change_mode_start >= self.change_mode_threshold
 
     @property
     def is_in_bpm_mode(self) -> bool:
-        if not self._change_mode_start:
-            return False
-        elapsed_time = time.time() - self._change_mode_start if self._change_mode_start else 0
-        return elapsed_time >= self.change_mode_threshold
+        return self.bpm_mode_at(self._event_time)
 
     def start_bpm_mode(self):
-        if not self._change_mode_start:
-            self._change_mode_start = time.time()
+        if self._change_mode_start is None:
+            self._change_mode_start = self._event_time
 
     def set_play_mode(self, skip_next_message=False):
         self._change_mode_start = None
@@ -56,16 +235,35 @@ class MVavePedalListener():
         if pedal_btn == self.change_mode_button:
             raise ValueError("Change mode button cannot be used for play behaviour")
         self._play_behaviours[pedal_btn] = callback
+        self._play_table = None
 
     def add_bpm_behaviour(self, pedal_btn: PedalButton, callback: Behavior):
         if pedal_btn == self.change_mode_button:
             raise ValueError("Change mode button cannot be used for BPM behaviour")
         self._bpm_behaviours[pedal_btn] = callback
+        self._play_table = None
+
+    def add_play_gesture(self, pedal_btn: PedalButton, gesture: str, callback: Behavior):
+        self._add_gesture(self._play_gestures, pedal_btn, gesture, callback)
+
+    def add_bpm_gesture(self, pedal_btn: PedalButton, gesture: str, callback: Behavior):
+        self._add_gesture(self._bpm_gestures, pedal_btn, gesture, callback)
+
+    def _add_gesture(self, gestures: dict, pedal_btn: PedalButton, gesture: str, callback: Behavior):
+        if gesture not in GESTURES:
+            raise ValueError(f"Unknown gesture {gesture}, expected one of {GESTURES}")
+        if pedal_btn == self.change_mode_button:
+            raise ValueError("Change mode button cannot be used for gestures")
+        gestures[(pedal_btn, gesture)] = callback
 
     def on_start(self, callback: Behavior):
         self._on_start = callback
         return self
 
+    def on_stop(self, callback: Behavior):
+        self._on_stop = callback
+        return self
+
     def on_event(self, callback: Behavior):
         self._on_event = callback
         return self
@@ -78,67 +276,196 @@ class MVavePedalListener():
         self._on_press_change_button = callback
         return self
 
+    def enable_metrics(self) -> Metrics:
+        # One histogram per behaviour, so only once every behaviour is added
+        callbacks = {(pedal_btn, False): callback for pedal_btn, callback in self._play_behaviours.items()}
+        callbacks.update({(pedal_btn, True): callback for pedal_btn, callback in self._bpm_behaviours.items()})
+        self._behaviour_metrics = {
+            (pedal_btn, is_bpm_mode): f"behaviour:{getattr(callback, '__name__', pedal_btn.name)}"
+            for (pedal_btn, is_bpm_mode), callback in callbacks.items()}
+        for is_bpm_mode in (False, True):
+            self._behaviour_metrics[(self.change_mode_button, is_bpm_mode)] = 'behaviour:change_mode'
+        self.metrics = Metrics(
+            'listener', METRICS_COUNTERS, METRICS_HISTOGRAMS + tuple(sorted(set(self._behaviour_metrics.values()))))
+        self.timings.metrics = self.metrics
+        return self.metrics
+
+    def _publish_metrics(self, midi_connector: MidiInOutConnector):
+        # Added as increments, a restarted listener's connector counts from zero again
+        self.metrics.count('reconnects', midi_connector.reconnects - self._reconnects_seen)  # type: ignore
+        self._reconnects_seen = midi_connector.reconnects
+        self.metrics.fold()  # type: ignore
+        self.metrics.set('messages_in', self.metrics.histograms['input'].count)  # type: ignore
+        self.metrics.publish()  # type: ignore
+
     def _skip_message(self) -> bool:
         skip = bool(self._skip_next_message)
         self._skip_next_message = False
         return skip
 
-    def _get_behavior_for_button(self, pedal_btn: PedalButton) -> Behavior | None:
-        if pedal_btn == self.change_mode_button:
-            if not self.is_in_bpm_mode:
-                behavior = lambda *args: self.start_bpm_mode()
-            else:
-                behavior = lambda *args: self.set_play_mode(skip_next_message=True)
+    def _press_change_button(self, midi_connector: MidiInOutConnector, midi_msg, delta, is_bpm_mode: bool):
+        if is_bpm_mode:
+            self.set_play_mode(skip_next_message=True)
+        else:
+            self.start_bpm_mode()
+        self._on_mode_change(midi_connector, midi_msg, delta, self.bpm_mode_at(self._event_time))
+        self._on_press_change_button()
+
+    def _play_mode_behaviour(self, callback: Behavior | None) -> Behavior:
+        def behaviour(midi_connector: MidiInOutConnector, midi_msg, delta, is_bpm_mode: bool):
+            # Any other button cancels a change mode press that has not reached the threshold yet
+            self.set_play_mode()
+            if callback:
+                callback(midi_connector, midi_msg, delta, is_bpm_mode)
+        return behaviour
+
+    def compile_dispatch(self):
+        # Flat tables keyed on the raw status and data bytes, built once instead of per message
+        play_table, bpm_table = {}, {}
+        self._buttons = {button_key(status, data): pedal_btn for pedal_btn, (status, data) in self.button_map.items()}
+        for key, pedal_btn in self._buttons.items():
+            if pedal_btn == self.change_mode_button:
+                play_table[key] = bpm_table[key] = self._press_change_button
+                continue
+            play_table[key] = self._play_mode_behaviour(self._play_behaviours.get(pedal_btn))
+            if pedal_btn in self._bpm_behaviours:
+                bpm_table[key] = self._bpm_behaviours[pedal_btn]
+        self._play_table, self._bpm_table = play_table, bpm_table
 
-            return lambda *args: (
-                behavior(*args),
-                self._on_mode_change(*args[:-1], self.is_in_bpm_mode),
-                self._on_press_change_button()
-            )  # type: ignore
+    def lookup(self, midi_msg: list[int], is_bpm_mode: bool) -> Behavior | None:
+        if self._play_table is None:
+            self.compile_dispatch()
+        table = self._bpm_table if is_bpm_mode else self._play_table
+        return table.get(button_key(midi_msg[0], midi_msg[1] if len(midi_msg) >= 2 else -1))  # type: ignore
 
-        if self.is_in_bpm_mode:
-            return self._bpm_behaviours.get(pedal_btn, None)
+    def _next_message(self, midi_connector: MidiInOutConnector, timeout: float):
+        if self.input_mode == INPUT_MODE_CALLBACK:
+            return midi_connector.wait_input_message(timeout=timeout)
+        time.sleep(self.poll_interval)
+        return midi_connector.get_input_message()
 
-        self.set_play_mode()
-        return self._play_behaviours.get(pedal_btn, None)
+    def _dispatch_gestures(self, midi_connector: MidiInOutConnector, gestures, is_bpm_mode: bool):
+        table = self._bpm_gestures if is_bpm_mode else self._play_gestures
+        for pedal_btn, gesture, seconds in gestures:
+            callback = table.get((pedal_btn, gesture))
+            if callback:
+                if self.journal is not None:
+                    self.journal.record(BEHAVIOUR, (
+                        _JOURNAL_BUTTON_IDS[pedal_btn], is_bpm_mode, GESTURES.index(gesture) + 1))
+                callback(midi_connector, list(self.button_map[pedal_btn]), seconds, is_bpm_mode)
 
     def listen(self, stop_event, midi_connector: MidiInOutConnector):
-        midi_connector.open_ports()
+        midi_connector.open_ports(with_output=self.open_output)
+        if self.input_mode == INPUT_MODE_CALLBACK:
+            midi_connector.enable_input_queue()
+        self._begin(midi_connector)
+        while not stop_event.is_set():
+            message = self._next_message(midi_connector, self._next_timeout())
+            self._step(midi_connector, message)
+        self._end(midi_connector)
+
+    async def listen_async(self, stop_event, midi_connector: MidiInOutConnector, next_message):
+        # Same loop for an asyncio runtime: next_message(timeout) is awaited for each input message,
+        # it returns None on timeout and sets the connector's last_input_at otherwise
+        midi_connector.open_ports(with_output=self.open_output)
+        self._begin(midi_connector)
+        while not stop_event.is_set():
+            message = await next_message(self._next_timeout())
+            self._step(midi_connector, message)
+        self._end(midi_connector)
+
+    def _begin(self, midi_connector: MidiInOutConnector):
+        if self._play_table is None:
+            self.compile_dispatch()
+        if self.journal is not None:
+            self.journal.open()
+            midi_connector.set_journal(self.journal)
+        self._timed_gestures = any(
+            gesture in (LONG_PRESS, REPEAT) for _, gesture in (*self._play_gestures, *self._bpm_gestures))
 
+        self._event_time = time.perf_counter()
         if self._on_start:
-            self._on_start(midi_connector, [], 0, self.is_in_bpm_mode)
+            self._on_start(midi_connector, [], 0.0, self.is_in_bpm_mode)
 
-        last_message_time = time.time()
-        while not stop_event.is_set():
-            time.sleep(0.001)
+        self.ready_at.value = time.perf_counter()
+        self._next_report = self.ready_at.value + self.report_interval
+        if self.metrics is not None:
+            self.metrics.resume()
+            self._reconnects_seen = midi_connector.reconnects
+            self._next_publish = self.ready_at.value
+        if self.freeze_gc:
+            # Once warmed up (ports, journal, start behaviour), what is allocated so far is never scanned again
+            gc.collect()
+            gc.freeze()
 
-            midi_connector.check_connection()
+    def _next_timeout(self) -> float:
+        deadline = self.gestures.next_deadline() if self._timed_gestures else None
+        if deadline is None:
+            return self.wake_interval
+        return max(0.0, min(self.wake_interval, deadline - time.perf_counter()))
 
-            message = midi_connector.get_input_message()
-            if not message:
-                continue
-            if self._skip_message():
-                continue
+    def _step(self, midi_connector: MidiInOutConnector, message):
+        received = time.perf_counter()
+        midi_connector.check_connection()
+        if received >= self._next_report:
+            self.timings.report('MIDI listener')
+            self._next_report = received + self.report_interval
 
-            _time = time.time()
-            delta_seconds = round(_time - last_message_time)
-            last_message_time = _time
-
-            if self._on_event:
-                self._on_event(midi_connector, message, delta_seconds, self.is_in_bpm_mode)
-
-            # (midi_msg, delta_seconds) = message
-            (midi_msg, _) = message
-            midi_msg_type = midi_msg[0]
-            midi_msg_data = midi_msg[1] if len(midi_msg) >= 2 else -1
-            # midi_msg_key = midi_msg[2] if len(midi_msg) >= 3 else -1
-            try:
-                midi_btn = PedalButton((midi_msg_type, midi_msg_data))
-            except ValueError:
-                logging.debug('Button not mapped: %s', (midi_msg_type, midi_msg_data))
-                continue
-            behaviour_callback = self._get_behavior_for_button(midi_btn)
-            if behaviour_callback:
-                behaviour_callback(midi_connector, midi_msg, delta_seconds, self.is_in_bpm_mode)
-            else:
-                logging.debug('Nothing found for %s', midi_msg)
+        if message:
+            self._handle_message(midi_connector, message, received)
+        if self._timed_gestures:
+            now = time.perf_counter()
+            self._dispatch_gestures(midi_connector, self.gestures.due(now), self.bpm_mode_at(now))
+        # After the message is handled, never ahead of a press
+        if self.metrics is not None and received >= self._next_publish:
+            self._publish_metrics(midi_connector)
+            self._next_publish = received + PUBLISH_INTERVAL
+
+    def _end(self, midi_connector: MidiInOutConnector):
+        if self._on_stop:
+            self._on_stop(midi_connector, [], 0.0, self.is_in_bpm_mode)
+        if self.metrics is not None:
+            self._publish_metrics(midi_connector)
+        if self.journal is not None:
+            self.journal.close()
+
+    def _handle_message(self, midi_connector: MidiInOutConnector, message, received: float):
+        (midi_msg, rtmidi_delta) = message
+        previous_time = self._event_time
+        timestamp = self.gestures.timestamp(rtmidi_delta, midi_connector.last_input_at)
+        self._event_time = midi_connector.last_event_at = timestamp
+        if self.journal is not None:
+            self.journal.record(IN, midi_msg, timestamp)
+        # Seconds since the previous message
+        delta = max(0.0, timestamp - previous_time)
+
+        self.timings.record('input', received - midi_connector.last_input_at)
+        if self._skip_message():
+            return
+
+        is_bpm_mode = self.bpm_mode_at(timestamp)
+        if self._on_event:
+            self._on_event(midi_connector, message, delta, is_bpm_mode)
+        if self.gestures.is_duplicate(midi_msg, timestamp):
+            logging.debug('Duplicate message ignored: %s', midi_msg)
+            if self.metrics is not None:
+                self.metrics.count('duplicates')
+            return
+
+        key = button_key(midi_msg[0], midi_msg[1] if len(midi_msg) >= 2 else -1)
+        pedal_btn = self._buttons.get(key)
+        if pedal_btn is None:
+            logging.debug('Button not mapped: %s', midi_msg)
+            return
+        behaviour_callback = (self._bpm_table if is_bpm_mode else self._play_table).get(key)  # type: ignore
+        if behaviour_callback is not None:
+            dispatched = time.perf_counter()
+            self.timings.record('dispatch', dispatched - received)
+            if self.journal is not None:
+                self.journal.record(BEHAVIOUR, (_JOURNAL_BUTTON_IDS[pedal_btn], is_bpm_mode, 0), dispatched)
+            behaviour_callback(midi_connector, midi_msg, delta, is_bpm_mode)
+            elapsed = time.perf_counter() - dispatched
+            self.timings.record('behaviour', elapsed)
+            if self.metrics is not None:
+                self.metrics.observe(self._behaviour_metrics.get((pedal_btn, is_bpm_mode), ''), elapsed)
+        self._dispatch_gestures(midi_connector, self.gestures.press(pedal_btn, timestamp), self.is_in_bpm_mode)
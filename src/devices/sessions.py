@@ -0,0 +1,62 @@
+import json
+import os
+import threading
+from collections import deque
+from multiprocessing.sharedctypes import RawValue
+
+
+Session = list[tuple[float, list[int]]]
+
+
+def load_session(path: str) -> Session:
+    # One JSON object per line: {"t": <seconds since session start>, "message": [status, data...]}
+    with open(path, encoding='utf-8') as session_file:
+        events = [json.loads(line) for line in session_file if line.strip()]
+    return sorted((float(event['t']), list(event['message'])) for event in events)
+
+
+def save_session(path: str, session: Session):
+    with open(path, 'w', encoding='utf-8') as session_file:
+        for offset, message in session:
+            session_file.write(json.dumps({'t': round(offset, 6), 'message': list(message)}) + '\n')
+
+
+class SessionRecorder():
+    # Created before the workers are started: the file is truncated once per run, and the session
+    # origin is shared so a restarted listener keeps appending on the same timeline. Events are buffered
+    # with add() and written by write(), from any thread: however late or seldom it runs, none is dropped.
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._owner_pid = None
+        with open(path, 'w', encoding='utf-8'):
+            pass
+        # perf_counter of the first recorded event, comparable between processes
+        self._started_at = RawValue('d', 0.0)
+        self._pending: deque = deque()
+        self._lock = threading.Lock()
+
+    def add(self, message: list[int], timestamp: float):
+        self._pending.append((message, timestamp))
+
+    def write(self):
+        if self._owner_pid != os.getpid():
+            self._owner_pid = os.getpid()
+            self._lock = threading.Lock()
+            self._file = open(self.path, 'a', encoding='utf-8')  # pylint: disable=consider-using-with
+        with self._lock:
+            pending = self._pending
+            if not pending:
+                return
+            while pending:
+                message, timestamp = pending.popleft()
+                if not self._started_at.value:
+                    self._started_at.value = timestamp
+                offset = timestamp - self._started_at.value
+                self._file.write(json.dumps({'t': round(offset, 6), 'message': list(message)}) + '\n')  # type: ignore
+            self._file.flush()  # type: ignore
+
+    def record(self, message: list[int], timestamp: float):
+        self.add(message, timestamp)
+        self.write()
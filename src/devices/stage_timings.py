@@ -0,0 +1,43 @@
+import logging
+import threading
+
+from devices.metrics import Metrics
+
+
+class StageTimings():
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: dict[str, list[float]] = {}
+        # Also fed the samples of the thread that owns it, for the stages it has histograms of
+        self.metrics: Metrics | None = None
+
+    def record(self, stage: str, seconds: float):
+        if self.metrics is not None:
+            self.metrics.observe(stage, seconds)
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                self._stages[stage] = [1, seconds, seconds]
+                return
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+
+    def snapshot(self) -> dict[str, tuple[int, float, float]]:
+        with self._lock:
+            return {stage: (int(count), total / count, peak) for stage, (count, total, peak) in self._stages.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+    def report(self, label: str):
+        stages = self.snapshot()
+        if not stages:
+            return
+        logging.info('%s timings: %s', label, ', '.join(
+            f'{stage} n={count} mean={mean * 1000:.3f}ms max={peak * 1000:.3f}ms'
+            for stage, (count, mean, peak) in stages.items()))
+        self.reset()
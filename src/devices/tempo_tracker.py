@@ -0,0 +1,90 @@
+TICKS_PER_BEAT = 24
+
+
+class TempoTracker():
+    # Alpha-beta filter (a fixed-gain Kalman filter, or a second-order PLL) over the arrival times of
+    # incoming clock ticks. Each tick moves the phase by alpha and the period by beta of its error against
+    # the prediction, so a single early or late tick barely moves the tempo while a real tempo change is
+    # followed within a few beats. The gains start from the least-squares ones and shrink down to
+    # alpha/beta, so the first beat acquires quickly.
+
+    def __init__(
+        self,
+        alpha: float = 0.1,
+        beta: float = 0.005,
+        reject: float = 0.35,
+        lock_ticks: int = TICKS_PER_BEAT,
+        settle_bpm: float = 0.5,
+        settle_beats: int = 4,
+        lost_after: int = 2 * TICKS_PER_BEAT,
+    ):
+        self.alpha = alpha
+        self.beta = beta
+        self.reject = reject
+        self.lock_ticks = lock_ticks
+        self.settle_bpm = settle_bpm
+        self.settle_beats = settle_beats
+        self.lost_after = lost_after
+        self.reset()
+
+    def reset(self):
+        self.phase: float | None = None
+        self.period: float | None = None
+        self.samples = 0
+        self.outliers = 0
+        self.settled_bpm: int | None = None
+        self._reference_bpm = 0.0
+        self._stable_ticks = 0
+
+    @property
+    def locked(self) -> bool:
+        return self.samples >= self.lock_ticks
+
+    @property
+    def bpm(self) -> float:
+        return 60.0 / (self.period * TICKS_PER_BEAT) if self.period else 0.0
+
+    def next_tick_after(self, at: float) -> float:
+        # First predicted tick later than `at`
+        ticks = int((at - self.phase) // self.period) + 1  # type: ignore
+        return self.phase + ticks * self.period  # type: ignore
+
+    def is_lost(self, now: float) -> bool:
+        return self.period is not None and now - self.phase > self.lost_after * self.period  # type: ignore
+
+    def tick(self, at: float):
+        if self.phase is None or self.period is None:
+            if self.phase is not None and at > self.phase:
+                self.period = at - self.phase
+            self.phase = at
+            return
+
+        # Ticks lost on the way show up as an arrival whole intervals later than predicted
+        steps = max(1, round((at - self.phase) / self.period))
+        predicted = self.phase + steps * self.period
+        error = at - predicted
+        if abs(error) > self.reject * self.period:
+            self.outliers += 1
+            if self.outliers > self.lock_ticks:
+                # Consistently off: the source jumped to another tempo, acquire it again
+                self.reset()
+                self.phase = at
+            return
+        self.outliers = 0
+
+        self.samples += 1
+        n = self.samples
+        alpha = max(self.alpha, 2.0 * (2 * n - 1) / (n * (n + 1)))
+        beta = max(self.beta, 6.0 / (n * (n + 1)))
+        self.phase = predicted + alpha * error
+        self.period += beta * error / steps
+        self._settle()
+
+    def _settle(self):
+        bpm = self.bpm
+        if abs(bpm - self._reference_bpm) > self.settle_bpm:
+            self._reference_bpm, self._stable_ticks = bpm, 0
+            return
+        self._stable_ticks += 1
+        if self.locked and self._stable_ticks >= self.settle_beats * TICKS_PER_BEAT:
+            self.settled_bpm = round(bpm)
@@ -1,12 +1,22 @@
+import time
+STARTED_AT = time.perf_counter()
+
+# pylint: disable=wrong-import-position
 import os
 import logging
-
-import fire
-from simple_term_menu import TerminalMenu
+import sys
 
 from app import mvave_drumbrute
-from app.data import StateStore
+from app.data import StateStore, DEFAULT_FLUSH_INTERVAL
+from app.metrics_endpoint import DEFAULT_METRICS_SOCKET, FETCH_TIMEOUT, fetch, summary
+from app.startup import StartupProfile
+from app.supervisor import DEFAULT_MAX_RESTARTS
 from devices import MidiInOutConnector
+from devices.device_profile import DEFAULT_DEVICE
+from devices.journal import DEFAULT_CAPACITY
+from devices.midi_connector import DEFAULT_CHECK_INTERVAL
+from devices.midi_clock import QUANTIZE_TICK, QUANTIZE_BAR
+from devices.mvave_pedal import INPUT_MODE_CALLBACK, DEFAULT_BUTTON_MAP
 
 
 DEFAULT_DB_FILE_PATH = '/tmp/mvave_drumbrute_state.db'
@@ -36,6 +46,9 @@ def select_midi_port_from_menu(
     except:  # pylint: disable=bare-except
         port = 0
 
+    # Interactive only, kept out of the quiet startup path
+    from simple_term_menu import TerminalMenu  # pylint: disable=import-outside-toplevel
+
     return TerminalMenu(
         available_ports,
         cursor_index=port,
@@ -51,11 +64,44 @@ def main(
     auto_select: bool = False,
     input_query: str | None = 'SINCO',
     output_query: str | None = 'Arturia',
+    clock_spin_window: float | None = None,
+    input_mode: str = INPUT_MODE_CALLBACK,
+    connection_check_interval: float = DEFAULT_CHECK_INTERVAL,
+    state_flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    tempo_quantize: str = QUANTIZE_TICK,
+    pattern_quantize: str = QUANTIZE_BAR,
+    lead_ticks: int = 0,
+    tap_tempo: bool = False,
+    tap_ramp_beats: int = 4,
+    record_session: str | None = None,
+    running_status: bool = False,
+    pedal_map: str = DEFAULT_BUTTON_MAP,
+    startup_profile: bool = False,
+    max_restarts: int = DEFAULT_MAX_RESTARTS,
+    runtime: str = mvave_drumbrute.RUNTIME_PROCESS,
+    realtime: bool = False,
+    journal: str | None = None,
+    journal_size: int = DEFAULT_CAPACITY,
+    clock_input_port: int | None = None,
+    clock_input_query: str | None = None,
+    output_latency_us: int = 0,
+    clock_outputs: str | None = None,
+    fanout_tolerance_us: int = 200,
+    device: str = DEFAULT_DEVICE,
+    device_channel: int | None = None,
+    setlist: str | None = None,
+    metrics_socket: str | None = DEFAULT_METRICS_SOCKET,
 ):
-    midi_connector = MidiInOutConnector()
+    profile = StartupProfile(STARTED_AT) if startup_profile else None
+    if profile:
+        profile.mark("imports")
+    midi_connector = MidiInOutConnector(check_interval=connection_check_interval, running_status=running_status)
+    midi_connector.set_queries(input_query, output_query)
     if db_file_path is None:
         raise ValueError("db_file_path must be set")
-    state_store = StateStore(db_file_path)
+    state_store = StateStore(db_file_path, flush_interval=state_flush_interval)
+    if profile:
+        profile.mark("state store")
 
     if auto_select:
         if not input_query or not output_query:
@@ -72,8 +118,22 @@ def main(
         if output_port is None and output_query is not None:
             output_port = midi_connector.query_output_port(output_query)
 
+    if clock_input_port is None and clock_input_query is not None:
+        clock_input_port = midi_connector.query_input_port(clock_input_query)
+        if clock_input_port is None:
+            raise ValueError(f"No MIDI input port matches clock input query {clock_input_query}")
+
+    extra_outputs = []
+    for query, latency_us in parse_clock_outputs(clock_outputs or ()):
+        port = midi_connector.query_output_port(query)
+        if port is None:
+            raise ValueError(f"No MIDI output port matches clock output {query}")
+        extra_outputs.append((port, latency_us))
+
     available_inputs = midi_connector.get_input_ports()
     available_outputs = midi_connector.get_output_ports()
+    if profile:
+        profile.mark("port enumeration")
 
     if not quiet:
         input_port = select_midi_port_from_menu(
@@ -93,6 +153,10 @@ def main(
     assert input_port is not None, "Input port must be set"
     assert output_port is not None, "Output port must be set"
     midi_connector.set_ports(input_port, output_port)
+    if any(port == output_port for port, _ in extra_outputs):
+        raise ValueError("The main output port cannot also be a clock output")
+    if profile:
+        profile.mark("port selection")
 
     logging.info(
         'Selected MIDI ports:\nINPUT %d (%s)\nOUTPUT %d (%s)\nLAST PATTERN:%d BPM:%d',
@@ -104,9 +168,107 @@ def main(
     mvave_drumbrute.run(
         midi_connector,
         state_store,
+        clock_spin_window=clock_spin_window,
+        input_mode=input_mode,
+        tempo_quantize=tempo_quantize,
+        pattern_quantize=pattern_quantize,
+        lead_ticks=lead_ticks,
+        tap_tempo=tap_tempo,
+        tap_ramp_beats=tap_ramp_beats,
+        record_session=record_session,
+        pedal_map=pedal_map,
+        startup_profile=profile,
+        max_restarts=max_restarts,
+        runtime=runtime,
+        realtime=realtime,
+        journal=journal,
+        journal_size=journal_size,
+        clock_input_port=clock_input_port,
+        clock_input_query=clock_input_query,
+        output_latency_us=output_latency_us,
+        clock_outputs=extra_outputs,
+        fanout_tolerance_us=fanout_tolerance_us,
+        device=device,
+        device_channel=device_channel,
+        setlist=setlist,
+        metrics_socket=metrics_socket,
     )
 
 
+def parse_clock_outputs(clock_outputs) -> list[tuple[str, int]]:
+    # NAME[:LATENCY_US],... where fire may already have split the list into a tuple
+    entries = clock_outputs.split(',') if isinstance(clock_outputs, str) else clock_outputs
+    outputs = []
+    for entry in entries:
+        query, _, latency_us = str(entry).strip().rpartition(':')
+        if not query or not latency_us.isdigit():
+            query, latency_us = str(entry).strip(), '0'
+        outputs.append((query, int(latency_us)))
+    return outputs
+
+
+def show_journal(*paths: str, tail: int = 50, ticks: bool = False):
+    # Offline: decode the journals written with --journal into one timeline, last `tail` events (0 for all)
+    from app.journal_report import report  # pylint: disable=import-outside-toplevel
+    print(report(list(paths), tail=tail, ticks=ticks))
+
+
+def show_status(socket_path: str = DEFAULT_METRICS_SOCKET, raw: bool = False):
+    # Live: the metrics of the running controller, as a table or as the Prometheus text it serves
+    try:
+        text = fetch(socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sys.exit(f"No controller running with metrics on {socket_path}")
+    except TimeoutError:
+        sys.exit(f"No answer from the controller on {socket_path} within {FETCH_TIMEOUT:g}s")
+    print(text if raw else summary(text))
+
+
+COMMANDS = {'journal': show_journal, 'status': show_status}
+
+
+def parse_value(value: str):
+    if value in ('None', 'True', 'False'):
+        return {'None': None, 'True': True, 'False': False}[value]
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def parse_flags(argv: list[str]) -> dict | None:
+    # Importing fire is most of the startup time: plain --name=value / --flag / --noflag command lines
+    # (what the embedded service runs) are parsed here, anything else goes through fire
+    names = main.__code__.co_varnames[:main.__code__.co_argcount]
+    kwargs = {}
+    for arg in argv:
+        if not arg.startswith('--'):
+            return None
+        name, has_value, value = arg[2:].partition('=')
+        name = name.replace('-', '_')
+        if has_value and name in names:
+            kwargs[name] = parse_value(value)
+        elif not has_value and name in names:
+            kwargs[name] = True
+        elif not has_value and name.startswith('no') and name[2:] in names:
+            kwargs[name[2:]] = False
+        else:
+            return None
+    return kwargs
+
+
 if __name__ == '__main__':
     setup_logging()
-    fire.Fire(main)
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        # Subcommands, startup time does not matter there
+        import fire
+        fire.Fire(COMMANDS[sys.argv[1]], sys.argv[2:])
+    else:
+        flags = parse_flags(sys.argv[1:])
+        if flags is None:
+            import fire
+            fire.Fire(main)
+        else:
+            main(**flags)